@@ -0,0 +1,278 @@
+# -*- coding:utf-8 -*-
+""" benchmarks of the optimizations (not a part of the test suite)
+
+python benchmarks/bench.py                 # all
+python benchmarks/bench.py union threads   # some of them
+python benchmarks/bench.py --quick         # small sizes
+
+each benchmark prints one json object per measurement.
+"""
+import argparse
+import atexit
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from timeit import default_timer
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+class Group(Base):
+    __tablename__ = "groups"
+    id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+    name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+class User(Base):
+    __tablename__ = "users"
+    id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+    group_id = sa.Column(sa.Integer(), sa.ForeignKey("groups.id"))
+    group = orm.relationship(Group, uselist=False, backref=("users"))
+    name = sa.Column(sa.String(255), unique=True, nullable=False)
+    score = sa.Column(sa.Integer(), nullable=False)
+
+
+def create_engine(n_users, n_groups=10):
+    """ a sqlite file database (shared by threads and processes), with n_users users
+    """
+    from block.sqla.lispy.workload import create_sqlite_copy
+    engine = create_sqlite_copy(Base)
+    atexit.register(os.remove, engine.url.database)
+    engine.execute(Group.__table__.insert(), [{"id": i, "name": "group{}".format(i)} for i in range(1, n_groups + 1)])
+    engine.execute(User.__table__.insert(), [{"id": i, "group_id": i % n_groups + 1, "name": "user{}".format(i), "score": i % 100}
+                                             for i in range(1, n_users + 1)])
+    return engine
+
+def make_parser(**kwargs):
+    """ a parser that doesn't bind a session (module level, so it can be given to worker processes)
+    """
+    from block.sqla.lispy import create_parser
+    return create_parser(Base, lambda *args: orm.Query(args), **kwargs)
+
+def report(name, **values):
+    values["benchmark"] = name
+    print(json.dumps(values, sort_keys=True))
+    sys.stdout.flush()
+
+def measure(fn):
+    """ (result, seconds, peak bytes allocated by python)
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = default_timer()
+    try:
+        result = fn()
+        elapsed = default_timer() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+## user-027: streaming serialization
+
+def bench_stream(quick):
+    from block.sqla.lispy.serialize import dump
+    n = 20000 if quick else 200000
+    engine = create_engine(n)
+    session = orm.sessionmaker(bind=engine)()
+    data = {"query": ":User", "order_by": ":User.id"}
+    parser = make_parser()
+
+    def whole():
+        start = default_timer()
+        users = parser(data).with_session(session).perform().all()
+        body = json.dumps([{"id": u.id, "group_id": u.group_id, "name": u.name, "score": u.score} for u in users])
+        return default_timer() - start, len(body)
+
+    def streamed():
+        start = default_timer()
+        chunks = dump(parser(data).with_session(session))
+        first = next(chunks)
+        first = first + next(chunks) # "[" and the first batch
+        ttfb = default_timer() - start
+        return ttfb, len(first) + sum(len(chunk) for chunk in chunks)
+
+    for name, fn in [("orm+json.dumps", whole), ("dump_json", streamed)]:
+        (ttfb, size), elapsed, peak = measure(fn)
+        session.expunge_all()
+        report("stream", method=name, rows=n, first_byte=ttfb, elapsed=elapsed, peak_bytes=peak, size=size)
+
+
+## user-031: columnar materialization
+
+def bench_columnar(quick):
+    n = 20000 if quick else 500000
+    engine = create_engine(n)
+    session = orm.sessionmaker(bind=engine)()
+    data = {"query": [":User.id", ":User.group_id", ":User.score"]}
+    parser = make_parser()
+
+    def rows():
+        columns = ([], [], [])
+        for row in parser(data).with_session(session):
+            for column, v in zip(columns, row):
+                column.append(v)
+        return columns
+
+    def columnar():
+        return parser(data).with_session(session).as_columns()
+
+    for name, fn in [("rows", rows), ("as_columns", columnar)]:
+        _, elapsed, peak = measure(fn)
+        report("columnar", method=name, rows=n, elapsed=elapsed, peak_bytes=peak)
+
+
+## user-033: large in-list
+
+def bench_in(quick):
+    from block.sqla.lispy import default_args_method_table, TemporaryTableInOperator
+    sizes = [10, 1000, 10000] if quick else [10, 1000, 10000, 100000, 1000000]
+    engine = create_engine(10000)
+    session = orm.sessionmaker(bind=engine)()
+    temporary = default_args_method_table.copy()
+    temporary["in"] = TemporaryTableInOperator(session.connection)
+    for name, parser in [("expanding", make_parser()), ("temporary_table", make_parser(args_method_table=temporary))]:
+        texts = set()
+        for size in sizes:
+            data = {"query": [["fn", "count", ":User.id"]], "filter": ["in", ":User.id", ["quote"] + list(range(size))]}
+            start = default_timer()
+            query = parser(data).with_session(session).perform()
+            count = query.scalar()
+            texts.add(str(query.statement.compile(dialect=engine.dialect)))
+            report("in", method=name, size=size, elapsed=default_timer() - start, count=count)
+        report("in", method=name, sql_texts=len(texts))
+        session.rollback()
+
+
+## user-039: threads
+
+def bench_threads(quick):
+    from block.sqla.lispy import QueryCache
+    from block.sqla.lispy.workload import replay, generate_documents
+    n = 500 if quick else 5000
+    engine = create_engine(1000)
+    parser = make_parser(cache=QueryCache())
+    documents = list(generate_documents(Base, 50)) * (n // 50)
+    Session = orm.sessionmaker(bind=engine)
+    for threads in [1, 2, 4, 8]:
+        result = replay(parser, documents, Session, threads=threads)
+        report("threads", threads=threads, documents=result["documents"], errors=len(result["errors"]),
+               throughput=result["throughput"], p99=result["latency"]["p99"])
+
+
+## user-040: allocations of the query builders
+
+def bench_allocations(quick):
+    from block.sqla.lispy import QueryProxy
+    from block.sqla.lispy.reverse import ReverseQuery, create_env
+    steps = 30
+    repeat = 100 if quick else 1000
+
+    def proxy_chain():
+        for _ in range(repeat):
+            q = QueryProxy(orm.Query(User))
+            for i in range(steps):
+                q = q.filter(User.id > i)
+
+    env = create_env()
+    def reverse_chain():
+        for _ in range(repeat):
+            q = ReverseQuery(env)(User)
+            for i in range(steps):
+                q = q.filter(User.id > i)
+
+    for name, fn in [("QueryProxy", proxy_chain), ("ReverseQuery", reverse_chain)]:
+        gc.collect()
+        tracemalloc.start()
+        start = default_timer()
+        fn()
+        elapsed = default_timer() - start
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+        report("allocations", builder=name, steps=steps, repeat=repeat, elapsed=elapsed, peak_bytes=peak, live_blocks=blocks)
+
+
+## user-043: process pool precompilation
+
+def bench_precompile(quick):
+    from block.sqla.lispy.precompile import Precompiler, compile_document, create_dialect
+    from block.sqla.lispy.workload import generate_documents
+    n = 500 if quick else 5000
+    documents = list(generate_documents(Base, n))
+    parser = make_parser()
+    dialect = create_dialect("sqlite")
+    start = default_timer()
+    for data in documents:
+        compile_document(parser, dialect, data)
+    report("precompile", processes=0, documents=n, throughput=n / (default_timer() - start))
+
+    for processes in sorted(set([1, 2, 4, os.cpu_count() or 1])):
+        with Precompiler(make_parser, "sqlite", processes=processes) as precompiler:
+            list(precompiler.compile_all(documents[:processes])) # start workers
+            start = default_timer()
+            compiled = list(precompiler.compile_all(documents))
+            elapsed = default_timer() - start
+        report("precompile", processes=processes, documents=len(compiled), throughput=n / elapsed)
+
+
+## user-046: UNION ALL batching
+
+def bench_union(quick):
+    from block.sqla.lispy.batch import UnionBatcher
+    n_groups = 20 if quick else 100
+    engine = create_engine(10000, n_groups=n_groups)
+    session = orm.sessionmaker(bind=engine)()
+    documents = [{"query": [["fn", "count", ":User.id"]], "filter": ["=", ":User.group_id", i]}
+                 for i in range(1, n_groups + 1)]
+    parser = make_parser()
+    batcher = UnionBatcher(parser)
+
+    round_trips = [0]
+    @sa.event.listens_for(engine, "before_cursor_execute")
+    def count(*args):
+        round_trips[0] += 1
+
+    def one_by_one():
+        return [parser(data).with_session(session).perform().all() for data in documents]
+
+    def batched():
+        return batcher(documents, session=session)
+
+    for name, fn in [("one_by_one", one_by_one), ("union_all", batched)]:
+        round_trips[0] = 0
+        start = default_timer()
+        results = fn()
+        report("union", method=name, documents=len(documents), round_trips=round_trips[0],
+               elapsed=default_timer() - start, rows=sum(len(rows) for rows in results))
+
+
+benchmarks = {
+    "stream": bench_stream,
+    "columnar": bench_columnar,
+    "in": bench_in,
+    "threads": bench_threads,
+    "allocations": bench_allocations,
+    "precompile": bench_precompile,
+    "union": bench_union,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmarks of block.sqla.lispy")
+    parser.add_argument("names", nargs="*", help=", ".join(sorted(benchmarks.keys())))
+    parser.add_argument("--quick", action="store_true", help="small sizes")
+    args = parser.parse_args(argv)
+    unknown = set(args.names).difference(benchmarks.keys())
+    if unknown:
+        parser.error("unknown benchmark: {}".format(", ".join(sorted(unknown))))
+    for name in args.names or sorted(benchmarks.keys()):
+        benchmarks[name](args.quick)
+        gc.collect() # sessions of the benchmark are closed in this thread (sqlite objects are bound to the thread)
+
+if __name__ == "__main__":
+    main()
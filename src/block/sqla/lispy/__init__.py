@@ -1,9 +1,125 @@
 # -*- coding:utf-8 -*-
 import sqlalchemy as sa
+import sqlalchemy.orm as orm
 import operator as op
+import itertools
+import types
+from sqlalchemy.util import string_types, LRUCache
 
-default_query_methods = ["filter","order_by", "join", "options"]
+default_query_methods = ["filter","order_by", "join", "options", "group_by", "having"]
 default_lazy_options = ["limit", "offset"]
+default_functions = ["count", "sum", "avg", "min", "max", "coalesce", "lower", "upper", "length", "abs", "round"]
+
+class InvalidElement(Exception):
+    pass
+
+def function_call(names):
+    """ ["fn", "count", ":User.id"] => sa.func.count(User.id)  (only whitelisted names)
+    """
+    names = frozenset(names)
+    def fn(name, *args):
+        if name not in names:
+            raise InvalidElement("function {} is not allowed. .. fn".format(name))
+        return getattr(sa.func, name)(*args)
+    return fn
+
+def is_literal(e):
+    return not (isinstance(e, sa.sql.ClauseElement) or hasattr(e, "__clause_element__"))
+
+class InOperator(object):
+    """ ["in", ":User.id", ["quote", 1, 2, 3]] => User.id.in_(bindparam("in_values", [1, 2, 3], expanding=True))
+
+    the sql text is same for any size of list. a list longer than chunk_size is split into or-ed IN clauses
+    (chunk_size=None never splits).
+    a bind parameter without value (sa.bindparam("ids"), e.g. of a template) is converted to an expanding one.
+    """
+    def __init__(self, chunk_size=1000):
+        self.chunk_size = chunk_size
+
+    def bindparam(self, values):
+        return sa.bindparam("in_values", values, expanding=True, unique=True)
+
+    def __call__(self, x, values):
+        if isinstance(values, sa.sql.elements.BindParameter) and values.value is None and not values.expanding:
+            return x.in_(sa.bindparam(values.key, type_=values.type, expanding=True))
+        if not isinstance(values, (list, tuple)) or not all(is_literal(e) for e in values):
+            return x.in_(values) # subquery, or list of sql expressions
+        values = list(values)
+        if self.chunk_size is None or len(values) <= self.chunk_size:
+            return x.in_(self.bindparam(values))
+        size = self.chunk_size
+        return sa.or_(*[x.in_(self.bindparam(values[i:i + size])) for i in range(0, len(values), size)])
+
+
+def _clear_temporary_tables(dbapi_connection, connection_record):
+    tables = connection_record.info.pop(TemporaryTableInOperator.info_key, None)
+    if not tables:
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name in tables:
+            cursor.execute("DROP TABLE IF EXISTS {}".format(name))
+    finally:
+        cursor.close()
+    dbapi_connection.commit()
+
+class TemporaryTableInOperator(InOperator):
+    """ a list longer than threshold is inserted into a temporary table (by executemany), and
+    compiled to `x IN (SELECT value FROM <temporary table> WHERE key = <key>)`.
+    (this avoids the limit on the number of bind parameters)
+
+    connection_factory should return the connection that the query is executed with, e.g. `lambda: Session.connection()`.
+    one temporary table is created per connection and type (lispy_in_integer, ...), and reused
+    while the connection is checked out. the tables are dropped when the connection is returned to the pool.
+
+    the query depends on the connection, so documents that use this are not cached (Parser.is_cacheable),
+    and this cannot be used where no connection is available (e.g. precompile workers).
+    """
+    info_key = "lispy_in_tables"
+
+    def __init__(self, connection_factory, threshold=500, chunk_size=1000):
+        super(TemporaryTableInOperator, self).__init__(chunk_size=chunk_size)
+        self.connection_factory = connection_factory
+        self.threshold = threshold
+        self.counter = itertools.count()
+
+    def is_large(self, values):
+        return isinstance(values, (list, tuple)) and len(values) > self.threshold and all(is_literal(e) for e in values)
+
+    def is_cacheable(self, data):
+        """ data is the "in" document, ["in", ":User.id", ["quote", 1, 2, ...]]
+        """
+        return not any(isinstance(e, (list, tuple)) and e and e[0] == "quote" and self.is_large(e[1:])
+                       for e in data[1:])
+
+    def get_table(self, connection, type_):
+        tables = connection.info.setdefault(self.info_key, {})
+        name = "lispy_in_{}".format(type_.__class__.__name__.lower())
+        if name not in tables:
+            table = sa.Table(name, sa.MetaData(),
+                             sa.Column("key", sa.Integer(), index=True),
+                             sa.Column("value", type_),
+                             prefixes=["TEMPORARY"])
+            table.create(connection)
+            pool = connection.engine.pool
+            if not sa.event.contains(pool, "checkin", _clear_temporary_tables):
+                sa.event.listen(pool, "checkin", _clear_temporary_tables)
+            tables[name] = table
+        return tables[name]
+
+    def __call__(self, x, values):
+        if not self.is_large(values):
+            return super(TemporaryTableInOperator, self).__call__(x, values)
+        connection = self.connection_factory()
+        table = self.get_table(connection, x.type)
+        key = next(self.counter)
+        insert = table.insert()
+        size = self.chunk_size
+        for i in range(0, len(values), size):
+            connection.execute(insert, [{"key": key, "value": v} for v in values[i:i + size]])
+        return x.in_(sa.select([table.c.value]).where(table.c.key == key))
+
+
 default_args_method_table = {
     "<": op.lt,
     "<=": op.le,
@@ -11,26 +127,86 @@ default_args_method_table = {
     ">=": op.ge,
     "=":  op.eq,
     "!=": op.ne,
-    "and": op.and_,
-    "or": op.or_,
-    "in": lambda x, y: x.in_(y),
+    "and": lambda *args: sa.and_(*args), # ["and", x, y, z]
+    "or": lambda *args: sa.or_(*args),
+    "in": InOperator(),
     "quote": lambda *args: args,
     "not": sa.not_,
     "like": lambda x, *args, **kwargs: getattr(x, "like")(*args, **kwargs),
     "notlike": lambda x, *args, **kwargs: sa.not_(getattr(x, "like")(*args, **kwargs)),
     "desc": sa.desc,
-    "asc": sa.asc
+    "asc": sa.asc,
+    "fn": function_call(default_functions),
+    "label": lambda x, name: x.label(name),
+    "any": lambda x, *args: x.any(*args),
+    "has": lambda x, *args: x.has(*args),
+}
+default_semi_join_methods = ["any", "has"]
+default_load_strategies = {
+    "select": "lazyload",
+    "joined": "joinedload",
+    "subquery": "subqueryload",
+    "selectin": "selectinload",
+    "immediate": "immediateload",
+    "noload": "noload",
+    "raise": "raiseload",
 }
 
-class InvalidElement(Exception):
-    pass
+def is_relationship(obj):
+    return isinstance(getattr(obj, "property", None), orm.RelationshipProperty)
+
+def is_column(obj):
+    return isinstance(getattr(obj, "property", None), orm.ColumnProperty)
+
+def primary_key_attributes(mapper):
+    return [mapper.get_property_by_column(c).key for c in mapper.primary_key]
+
+class DeferHeavyColumns(object):
+    """ default projection policy. columns of heavy types (text, blob) are not loaded, unless "fields" has them.
+
+    models is a per-model override, {User: ["bio", "avatar"]}
+    """
+    def __init__(self, types=(sa.Text, sa.LargeBinary), models=None):
+        self.types = types
+        self.models = models or {}
+
+    def deferred(self, mapper):
+        if mapper.class_ in self.models:
+            return list(self.models[mapper.class_])
+        return [prop.key for prop in mapper.column_attrs
+                if prop.key not in primary_key_attributes(mapper)
+                and any(isinstance(c.type, self.types) for c in prop.columns)]
+
+    def __call__(self, cls):
+        keys = self.deferred(sa.inspect(cls))
+        return [orm.Load(cls).defer(k) for k in keys]
+
+class RelationshipPath(object):
+    """ ":User.group.name" => User.group (joined as an alias) and Group.name
+    """
+    def __init__(self, entity, relationships, attribute):
+        self.entity = entity
+        self.relationships = relationships
+        self.attribute = attribute
+
+    def keys(self):
+        """ join keys for each relationship, (User, ("group",)), (User, ("group", "owner")), ...
+        """
+        names = ()
+        for rel in self.relationships:
+            names += (rel.key,)
+            yield (self.entity, names)
+
+    @property
+    def key(self):
+        return (self.entity, tuple(rel.key for rel in self.relationships))
 
 class MapperHandler(object):
     def __init__(self, base):
         self.base = base
 
     def match(self, e):
-        return hasattr(e, "startswith") and e.startswith(":")
+        return isinstance(e, string_types) and e.startswith(":")
 
     def handle(self, e):
         try:
@@ -38,36 +214,89 @@ class MapperHandler(object):
             nodes = name_list.split(".")
             name = nodes[0]
             attrs = nodes[1:]
-            obj = self.base._decl_class_registry[name]
+            entity = obj = self.base._decl_class_registry[name]
+            relationships = []
             for attr in attrs:
+                if is_relationship(obj):
+                    relationships.append(obj)
+                    obj = obj.property.mapper.class_
                 try:
                     obj = getattr(obj, attr)
                 except AttributeError:
                     raise InvalidElement("attribute {} is not found. .. Mapper.attribute".format(attr))
+            if relationships:
+                return RelationshipPath(entity, relationships, obj)
             return obj
         except KeyError:
             raise InvalidElement("{} is not found. .. Mapper".format(e))
 
 
+_method_wrappers = {}
+
+def method_wrapper(name):
+    """ proxy.<name>(*args) => proxy.__class__(proxy.query.<name>(*args), ...). (one function per name)
+    """
+    try:
+        return _method_wrappers[name]
+    except KeyError:
+        def wrapped(self, *args, **kwargs):
+            ## fixme:
+            if args and isinstance(args[0], (list, tuple)):
+                args = args[0]
+            new_query = getattr(self.query, name)(*args, **kwargs)
+            return self.__class__(new_query, lazy_options=self.lazy_options, aliases=self.aliases)
+        wrapped.__name__ = name
+        return _method_wrappers.setdefault(name, wrapped)
+
 class QueryProxy(object):
-    def __init__(self, query, lazy_options=None):
+    """ immutable. every method returns a new proxy (lazy_options is a tuple, and aliases are copied on write)
+    """
+    __slots__ = ("query", "lazy_options", "aliases")
+
+    def __init__(self, query, lazy_options=(), aliases=None):
         self.query = query
-        self.lazy_options = lazy_options or []
+        self.lazy_options = tuple(lazy_options)
+        self.aliases = aliases or {}
 
     def __getattr__(self, k):
         attr = getattr(self.query, k)
         if callable(attr):
-            def wrapped(*args, **kwargs):
-                ## fixme:
-                if isinstance(args[0], (list, tuple)):
-                    args = args[0]
-                new_query = attr(*args, **kwargs)
-                return self.__class__(new_query, lazy_options=self.lazy_options[:])
-            wrapped.__name__ = attr.__name__
-            return wrapped
+            return types.MethodType(method_wrapper(k), self)
         else:
             return attr
 
+    def lazy(self, action):
+        return self.__class__(self.query, lazy_options=self.lazy_options + (action,), aliases=self.aliases)
+
+    def join_path(self, path):
+        """ join relationships of the path. each relationship is joined once, as an alias.
+        (outer join, a row without the related object is kept, e.g. ["or", <filter on User>, <filter on User.group>])
+        """
+        query = self.query
+        aliases = self.aliases
+        parent = path.entity
+        for rel, key in zip(path.relationships, path.keys()):
+            if key not in aliases:
+                alias = orm.aliased(rel.property.mapper.class_)
+                query = query.outerjoin(alias, getattr(parent, rel.key))
+                aliases = aliases.copy()
+                aliases[key] = alias
+            parent = aliases[key]
+        if query is self.query:
+            return self
+        return self.__class__(query, lazy_options=self.lazy_options, aliases=aliases)
+
+    def resolve_path(self, path):
+        try:
+            alias = self.aliases[path.key]
+        except KeyError:
+            raise InvalidElement("{}.{} is not joined. .. Path".format(path.entity.__name__, ".".join(path.key[1])))
+        return getattr(alias, path.attribute.key)
+
+    def as_columns(self, **kwargs):
+        from block.sqla.lispy.columnar import as_columns
+        return as_columns(self, **kwargs)
+
     def __iter__(self):
         return iter(self.perform())
 
@@ -84,7 +313,7 @@ def cascade(xs):
     """ {"@cascade": [{"query": U, "filter": ["=", "id", 1]}, {"filter": ["=", "name", "foo"]}]}
         => {"query": {"query": U, "filter": ["=", "id", 1]}, "filter": ["=", "name", "foo"]}
     """
-    result = xs[0]
+    result = dict(xs[0])
     for x in xs[1:]:
         nested = {}
         for k in x.keys():
@@ -113,14 +342,117 @@ def merge_from_one_or_many(xs, ys):
     return xs
 
 def insert_bottom(query_dict, q):
-    if not "query" in query_dict:
-        query_dict["query"] = q
+    """ returns a new dict, q is inserted as the innermost query (query_dict is not modified)
+    """
+    result = dict(query_dict)
+    if not "query" in result:
+        result["query"] = q
     else:
-        sub = query_dict["query"]
+        sub = result["query"]
         if not hasattr(sub, "keys"):
-            query_dict["query"] = merge_from_one_or_many(sub, q)
+            result["query"] = merge_from_one_or_many(sub, q)
         else:
-            insert_bottom(sub, q)
+            result["query"] = insert_bottom(sub, q)
+    return result
+
+class Uncacheable(Exception):
+    pass
+
+def structural_key(data):
+    """ hashable key of json like data. (1, 1.0 and True are distinguished)
+    a bind parameter without value (e.g. sa.bindparam("tenant_id")) is keyed by its name
+    """
+    if hasattr(data, "keys"):
+        return (dict, tuple((k, structural_key(data[k])) for k in sorted(data.keys())))
+    elif isinstance(data, (list, tuple)):
+        return (list, tuple(structural_key(e) for e in data))
+    elif data is None or isinstance(data, (bool, int, float) + string_types):
+        return (type(data), data)
+    elif isinstance(data, sa.sql.expression.BindParameter) and data.required:
+        return (sa.sql.expression.BindParameter, data.key)
+    raise Uncacheable(data)
+
+def sub_query_key(key):
+    return dict(key[1])["query"]
+
+class QueryCache(object):
+    """ memoize QueryProxy per (nested) query document.
+
+    cached queries are shared between requests, so they are stored without a session. a cached query is
+    bound to the session of the query_factory at each call (e.g. the current session of `scoped_session.query`).
+    with a query_factory that doesn't bind a session (e.g. `lambda *args: orm.Query(args)`),
+    the session should be given later by `query.with_session(session)`.
+
+    no lock is taken. concurrent misses of the same key may build the query twice (the last one is kept),
+    and hits/misses are approximate under threads.
+    """
+    def __init__(self, capacity=100):
+        self.queries = LRUCache(capacity)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, data):
+        try:
+            return structural_key(data)
+        except Uncacheable:
+            return None
+
+    def get(self, key):
+        query = self.queries.get(key)
+        if query is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return query
+
+    def set(self, key, query):
+        self.queries[key] = query
+
+class MacroRegistry(object):
+    """ macros of the parser ({"@name": args}).
+    the expansion of a pure macro depends only on its args, so it is memoized by structural_key(args).
+
+    registry = MacroRegistry()
+    registry.register("recent", lambda days: {"filter": [">", ":Article.created_at", ...]}, pure=True)
+    parser = create_parser(Base, query_factory, macros=registry)
+
+    expansions are shared, they must not be modified (parse_macro doesn't modify them).
+    a macro that depends on request state (e.g. tenant) can be pure, if it emits a bind parameter
+    (sa.bindparam("tenant_id")) instead of the value, and the value is given later by query.params(tenant_id=...)
+    """
+    def __init__(self, macros=default_macros, capacity=100):
+        self.macros = {}
+        self.expansions = LRUCache(capacity)
+        for name, fn in macros.items():
+            self.register(name, fn)
+
+    def register(self, name, fn, pure=False):
+        if pure:
+            fn = self.memoize(name, fn)
+        self.macros[name] = fn
+        return fn
+
+    def memoize(self, name, fn):
+        def memoized(args):
+            try:
+                key = (name, structural_key(args))
+            except Uncacheable:
+                return fn(args)
+            expansion = self.expansions.get(key)
+            if expansion is None:
+                expansion = self.expansions[key] = fn(args)
+            return expansion
+        memoized.__name__ = getattr(fn, "__name__", name)
+        return memoized
+
+    def __contains__(self, name):
+        return name in self.macros
+
+    def __getitem__(self, name):
+        try:
+            return self.macros[name]
+        except KeyError:
+            raise InvalidElement("macro {} is not found. .. Macro".format(name))
 
 class CompositeHandler(object):
     def __init__(self, handlers=None):
@@ -142,64 +474,204 @@ class IdentityHandler(object):
         return e
 
 class Parser(object):
+    """ the parser is not modified after construction, and input documents are not modified.
+    so one parser can be shared between threads.
+    """
     def __init__(self, query_factory,
                  handler, 
                  macros=default_macros,
                  query_methods=default_query_methods,
                  lazy_query_methods=default_lazy_options,
-                 args_method_table=default_args_method_table
+                 args_method_table=default_args_method_table,
+                 cache=None,
+                 semi_join_methods=default_semi_join_methods,
+                 budget=None,
+                 statement_timeout=None,
+                 load_strategies=default_load_strategies,
+                 projection=None
              ):
         self.handler = handler
+        self.projection = projection
+        self.load_strategies = load_strategies
+        self.budget = budget
+        self.statement_timeout = statement_timeout
+        self.cache = cache
+        self.semi_join_methods = semi_join_methods
         self.query_factory = query_factory
         self.macros = macros
-        self.query_methods = query_methods
-        self.lazy_query_methods = lazy_query_methods
+        self.query_methods = tuple(query_methods)
+        self.lazy_query_methods = tuple(lazy_query_methods)
         self.args_method_table = args_method_table
 
     def __call__(self, data, query=None):
+        if self.budget is not None:
+            self.budget.check_size(data)
         data = self.parse_macro(data)
-        return self.parse(data, query=query)
+        if self.budget is not None:
+            self.budget.check(data)
+        query = self.parse(data, query=query)
+        if self.statement_timeout is not None:
+            query = query.execution_options(statement_timeout=self.statement_timeout)
+        return query
 
     def parse_macro(self, data):
+        """ returns a new document, macros are expanded (data is not modified)
+        """
         if hasattr(data, "keys"):
-            ks = list(data.keys())
-            for k in ks:
-                v = self.parse_macro(data[k])
+            values = [(k, self.parse_macro(v)) for k, v in data.items()]
+            result = {k: v for k, v in values if not k.startswith("@")}
+            for k, v in values:
                 if k.startswith("@"):
-                    del data[k]
                     converted = self.macros[k[1:]](v)
-                    if not "query" in data or not "query" in converted:
-                        data.update(converted)
-                    else:
-                        insert_bottom(converted, data.pop("query"))
-                        data.update(converted)
+                    if "query" in result and "query" in converted:
+                        converted = insert_bottom(converted, result.pop("query"))
+                    result.update(converted)
+            return result
         elif isinstance(data, (tuple, list)):
             return [self.parse_macro(v) for v in data]
         return data
 
+    def is_cacheable(self, data):
+        """ False if an args method refuses the document (e.g. TemporaryTableInOperator with a large list)
+        """
+        if hasattr(data, "keys"):
+            return all(self.is_cacheable(v) for v in data.values())
+        elif isinstance(data, (list, tuple)):
+            if data and isinstance(data[0], string_types):
+                is_cacheable = getattr(self.args_method_table.get(data[0]), "is_cacheable", None)
+                if is_cacheable is not None and not is_cacheable(data):
+                    return False
+            return all(self.is_cacheable(e) for e in data)
+        return True
+
     def parse(self, data, query=None):
+        if self.cache is not None and query is None and self.is_cacheable(data):
+            key = self.cache.key(data)
+            if key is not None:
+                return self.parse_cached(data, key)
         if hasattr(data, "keys") and "query" in data:
             query = self.parse(data["query"], query=query)
-            for m in self.query_methods:
-                if m in data:
-                    method = getattr(query, m)
-                    query = method(self.parse_args(data[m], query=query))
-            for m in self.lazy_query_methods:
-                if m in data:
-                    args = self.parse_args(data[m], query=query)
-                    if not isinstance(args, (list, tuple)):
-                        args = [args]
-                    def lazy_action(q, name=m):
-                        return getattr(q, name)(*args)
-                    query.lazy_options.append(lazy_action)
-            return query
+            return self.apply(data, query)
         else:
             assert query is None
-            handle = self.handler.handle
-            if isinstance(data, (list, tuple)):
-                return QueryProxy(self.query_factory(*(handle(e) for e in data)))
+            return self.parse_target(data)
+
+    def parse_target(self, data):
+        if isinstance(data, (list, tuple)):
+            entities = [self.parse_args(e) for e in data]
+        else:
+            entities = [self.handler.handle(data)]
+        query = QueryProxy(self.query_factory(*entities))
+        if self.projection is not None:
+            options = [o for e in entities if isinstance(e, type) for o in self.projection(e)]
+            if options:
+                query = query.options(*options)
+        return query
+
+    def parse_cached(self, data, key):
+        if not (hasattr(data, "keys") and "query" in data):
+            return self.parse_target(data)
+        query = self.cache.get(key)
+        if query is None:
+            query = self.parse_cached(data["query"], sub_query_key(key))
+            query = self.apply(data, query)
+            self.cache.set(key, query.with_session(None)) # a session is not shared between requests
+            return query
+        return self.bind_session(query)
+
+    def bind_session(self, query):
+        session = self.query_factory().session
+        if session is None:
+            return query
+        return query.with_session(session)
+
+    def apply(self, data, query):
+        for m in self.query_methods:
+            if m in data:
+                for path in self.collect_paths(data[m]):
+                    query = query.join_path(path)
+                method = getattr(query, m)
+                query = method(self.parse_args(data[m], query=query))
+        if "load" in data:
+            query = query.options(*self.parse_load(data["load"], query=query))
+        if "fields" in data:
+            query = query.options(*self.parse_fields(data["fields"]))
+        for m in self.lazy_query_methods:
+            if m in data:
+                args = self.parse_args(data[m], query=query)
+                if not isinstance(args, (list, tuple)):
+                    args = [args]
+                def lazy_action(q, name=m, args=args):
+                    return getattr(q, name)(*args)
+                query = query.lazy(lazy_action)
+        return query
+
+    def parse_load(self, data, query):
+        """ {"group": "joined", "group.users": "selectin", "*": "raise"} => loader options
+        (relationship names are relative to the first entity of the query)
+        """
+        entity = query.column_descriptions[0]["entity"]
+        options = []
+        for path, strategy in sorted(data.items()):
+            try:
+                loader = self.load_strategies[strategy]
+            except KeyError:
+                raise InvalidElement("load strategy {} is not found. .. Load".format(strategy))
+            if path == "*":
+                options.append(getattr(orm, loader)("*"))
+                continue
+            option, cls = orm, entity
+            names = path.split(".")
+            for i, name in enumerate(names):
+                prop = sa.inspect(cls).relationships.get(name)
+                if prop is None:
+                    raise InvalidElement("relationship {} is not found. .. Load".format(name))
+                option = getattr(option, loader if i == len(names) - 1 else "defaultload")(getattr(cls, name))
+                cls = prop.mapper.class_
+            options.append(option)
+        return options
+
+    def parse_fields(self, data):
+        """ [":User.name", ":User.group.name"] => load_only options.
+        primary keys (and foreign keys of the relationships in nested fields) are always loaded,
+        and the other columns of an entity (or a relationship) that appears in fields are deferred.
+        """
+        fields = {}  # (entity, relationships) -> attribute keys
+        for token in data:
+            e = self.handler.handle(token)
+            if isinstance(e, RelationshipPath):
+                entity, relationships, attr = e.entity, tuple(e.relationships), e.attribute
             else:
-                return QueryProxy(self.query_factory(handle(data)))
+                entity, relationships, attr = getattr(e, "class_", None), (), e
+            if not is_column(attr):
+                raise InvalidElement("field {} is not a column. .. Fields".format(token))
+            for i, rel in enumerate(relationships):
+                parent = fields.setdefault((entity, relationships[:i]), [])
+                parent.extend(rel.property.parent.get_property_by_column(c).key for c in rel.property.local_columns)
+            fields.setdefault((entity, relationships), []).append(attr.key)
+
+        options = []
+        for (entity, relationships), keys in fields.items():
+            option = orm.Load(entity)
+            for rel in relationships:
+                option = option.defaultload(rel)
+            mapper = relationships[-1].property.mapper if relationships else sa.inspect(entity)
+            keys = primary_key_attributes(mapper) + keys
+            options.append(option.load_only(*sorted(set(keys), key=keys.index)))
+        return options
+
+    def collect_paths(self, data):
+        """ relationship paths to be joined. (criteria of any/has are not joined, these are EXISTS)
+        """
+        if isinstance(data, (tuple, list)):
+            args = data[1:2] if data[0] in self.semi_join_methods else data[1:]
+            for e in args:
+                for path in self.collect_paths(e):
+                    yield path
+        elif isinstance(data, string_types):
+            e = self.handler.handle(data)
+            if isinstance(e, RelationshipPath):
+                yield e
 
     def parse_args(self, data, query=None):
         if isinstance(data, (tuple, list)):
@@ -207,7 +679,12 @@ class Parser(object):
             args = [self.parse_args(e, query=query) for e in data[1:]]
             return op(*args)
         else:
-            return self.handler.handle(data)
+            e = self.handler.handle(data)
+            if isinstance(e, RelationshipPath):
+                if query is None:
+                    raise InvalidElement("{} is not joined. .. Path".format(data))
+                return query.resolve_path(e)
+            return e
 
 def create_handler(base):
     return CompositeHandler([MapperHandler(base), IdentityHandler()])
@@ -217,14 +694,26 @@ def create_parser(base, query_factory,
                   macros=default_macros,
                   query_methods=default_query_methods,
                   lazy_query_methods=["limit", "offset"],
-                  args_method_table=default_args_method_table):
+                  args_method_table=default_args_method_table,
+                  cache=None,
+                  semi_join_methods=default_semi_join_methods,
+                  budget=None,
+                  statement_timeout=None,
+                  load_strategies=default_load_strategies,
+                  projection=None):
     handler = handler or create_handler(base)
     return Parser(query_factory,
                   handler,
                   macros=macros,
                   query_methods=query_methods,
                   lazy_query_methods=lazy_query_methods,
-                  args_method_table=args_method_table)
+                  args_method_table=args_method_table,
+                  cache=cache,
+                  semi_join_methods=semi_join_methods,
+                  budget=budget,
+                  statement_timeout=statement_timeout,
+                  load_strategies=load_strategies,
+                  projection=projection)
 
 def includeme(config):
     from zope.interface import Interface, provider
@@ -0,0 +1,67 @@
+# -*- coding:utf-8 -*-
+import sqlalchemy as sa
+from collections import OrderedDict
+from block.sqla.lispy.stable import shape_of
+
+default_unbatchable_methods = ("limit", "offset", "order_by")
+
+def has_any_key(data, keys):
+    if hasattr(data, "keys"):
+        return any(k in keys or has_any_key(data[k], keys) for k in data.keys())
+    elif isinstance(data, (list, tuple)):
+        return any(has_any_key(e, keys) for e in data)
+    return False
+
+class UnionBatcher(object):
+    """ execute sibling query documents of the same shape (e.g. one count per group) by one UNION ALL statement.
+    each select has a discriminator column (batch_index), and the rows are split back per document.
+
+    documents that have limit, offset or order_by are executed one by one (these are not kept in a union).
+
+    batcher = UnionBatcher(parser)
+    results = batcher([{"query": [["fn", "count", ":User.id"]], "filter": ["=", ":User.group_id", 1]},
+                       {"query": [["fn", "count", ":User.id"]], "filter": ["=", ":User.group_id", 2]}], session=Session)
+    ## => [[(2,)], [(1,)]]
+    """
+    discriminator = "batch_index"
+
+    def __init__(self, parser, unbatchable_methods=default_unbatchable_methods):
+        self.parser = parser
+        self.unbatchable_methods = unbatchable_methods
+
+    def group(self, documents):
+        """ [[index, ...], ...] indices of documents executed by one statement
+        """
+        groups = OrderedDict()
+        for i, data in enumerate(documents):
+            if has_any_key(data, self.unbatchable_methods):
+                groups[("unbatchable", i)] = [i]
+            else:
+                groups.setdefault(shape_of(data), []).append(i)
+        return list(groups.values())
+
+    def query(self, data, session=None):
+        query = self.parser(data)
+        if session is not None:
+            query = query.with_session(session)
+        return query.perform()
+
+    def __call__(self, documents, session=None):
+        documents = [self.parser.parse_macro(data) for data in documents]
+        results = [None] * len(documents)
+        for indices in self.group(documents):
+            if len(indices) == 1:
+                results[indices[0]] = self.query(documents[indices[0]], session=session).all()
+            else:
+                self.execute_union(documents, indices, results, session=session)
+        return results
+
+    def execute_union(self, documents, indices, results, session=None):
+        queries = [self.query(documents[i], session=session) for i in indices]
+        descriptions = queries[0].column_descriptions
+        single = len(descriptions) == 1 and descriptions[0]["expr"] is descriptions[0]["entity"] # ":User"
+        queries = [q.add_columns(sa.literal(i).label(self.discriminator)) for i, q in zip(indices, queries)]
+        for i in indices:
+            results[i] = []
+        for row in queries[0].union_all(*queries[1:]):
+            results[row[-1]].append(row[0] if single else tuple(row[:-1]))
@@ -0,0 +1,135 @@
+# -*- coding:utf-8 -*-
+import time
+import sqlalchemy as sa
+from sqlalchemy.util import string_types
+from block.sqla.lispy import InvalidElement, is_literal
+
+class BudgetExceeded(InvalidElement):
+    def __init__(self, limit, value, maximum):
+        super(BudgetExceeded, self).__init__("{} exceeds {} ({}). .. Budget".format(limit, maximum, value))
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+
+    def as_dict(self):
+        return {"limit": self.limit, "value": self.value, "maximum": self.maximum}
+
+
+class Budget(object):
+    """ complexity budget of a (macro expanded) query document, checked before parsing.
+    None means unlimited.
+
+    the raw document is checked by check_size (nodes and depth) before macro expansion,
+    so a deeply nested document fails with BudgetExceeded instead of RecursionError.
+    """
+    def __init__(self, max_nodes=None, max_depth=None, max_joins=None, max_in_size=None, max_limit=None,
+                 join_methods=("join",), in_methods=("in",), limit_methods=("limit",)):
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.max_joins = max_joins
+        self.max_in_size = max_in_size
+        self.max_limit = max_limit
+        self.join_methods = join_methods
+        self.in_methods = in_methods
+        self.limit_methods = limit_methods
+
+    def verify(self, limit, value, maximum):
+        if maximum is not None and value > maximum:
+            raise BudgetExceeded(limit, value, maximum)
+
+    def size_of(self, e):
+        if isinstance(e, (list, tuple)):
+            if e and e[0] == "quote":
+                return len(e) - 1
+            return len(e)
+        return 1
+
+    def coerce_limit(self, limit):
+        """ sqlalchemy coerces limit by int(), e.g. "100000", 1e6
+        """
+        try:
+            return int(limit)
+        except (TypeError, ValueError):
+            raise InvalidElement("limit {!r} is not an integer. .. Budget".format(limit))
+
+    def check_size(self, data):
+        """ nodes and depth only (the document may have unexpanded macros)
+        """
+        nodes = 0
+        stack = [(data, 1)]
+        while stack:
+            e, depth = stack.pop()
+            nodes += 1
+            self.verify("nodes", nodes, self.max_nodes)
+            self.verify("depth", depth, self.max_depth)
+            if hasattr(e, "keys"):
+                stack.extend((v, depth + 1) for v in e.values())
+            elif isinstance(e, (list, tuple)):
+                stack.extend((x, depth + 1) for x in e)
+        return data
+
+    def check(self, data):
+        nodes = 0
+        joins = 0
+        paths = set()
+        stack = [(data, 1)]
+        while stack:
+            e, depth = stack.pop()
+            nodes += 1
+            self.verify("nodes", nodes, self.max_nodes)
+            self.verify("depth", depth, self.max_depth)
+            if hasattr(e, "keys"):
+                for k, v in e.items():
+                    if k in self.join_methods:
+                        joins += 1
+                    elif k in self.limit_methods:
+                        limit = v[-1] if isinstance(v, (list, tuple)) and v else v
+                        if self.max_limit is not None and is_literal(limit): # a bind parameter is given later
+                            self.verify("limit", self.coerce_limit(limit), self.max_limit)
+                    stack.append((v, depth + 1))
+            elif isinstance(e, (list, tuple)):
+                if len(e) > 2 and e[0] in self.in_methods:
+                    self.verify("in_size", self.size_of(e[2]), self.max_in_size)
+                stack.extend((x, depth + 1) for x in e)
+            elif isinstance(e, string_types) and e.startswith(":"):
+                names = e[1:].split(".")
+                for i in range(2, len(names)): # ":User.group.name" => User.group
+                    paths.add(tuple(names[:i]))
+        self.verify("joins", joins + len(paths), self.max_joins)
+        return data
+
+
+## statement timeout
+
+def _sqlite_timeout(conn, cursor, timeout):
+    if timeout is None:
+        conn.connection.set_progress_handler(None, 0)
+    else:
+        deadline = time.time() + timeout
+        conn.connection.set_progress_handler(lambda: time.time() > deadline, 1000)
+
+def _postgresql_timeout(conn, cursor, timeout):
+    cursor.execute("SET statement_timeout = {}".format(int((timeout or 0) * 1000)))
+
+def _mysql_timeout(conn, cursor, timeout):
+    cursor.execute("SET SESSION MAX_EXECUTION_TIME = {}".format(int((timeout or 0) * 1000)))
+
+default_timeout_setters = {
+    "sqlite": _sqlite_timeout,
+    "postgresql": _postgresql_timeout,
+    "mysql": _mysql_timeout,
+}
+
+def install_statement_timeout(engine, setters=default_timeout_setters):
+    """ apply the statement_timeout(seconds) execution option of each statement,
+    e.g. query.execution_options(statement_timeout=2.0)
+    """
+    setter = setters[engine.dialect.name]
+    @sa.event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        timeout = context.execution_options.get("statement_timeout") if context is not None else None
+        if timeout is None and conn.info.get("statement_timeout") is None:
+            return
+        conn.info["statement_timeout"] = timeout
+        setter(conn, cursor, timeout)
+    return before_cursor_execute
@@ -0,0 +1,85 @@
+# -*- coding:utf-8 -*-
+from array import array
+from itertools import islice
+from collections import OrderedDict
+from sqlalchemy.util import string_types
+from block.sqla.lispy.serialize import perform, projection, fetch_batches
+
+default_typecodes = {int: "q", float: "d", bool: "B"}
+
+class DictionaryColumn(object):
+    """ low cardinality strings, as codes(array) and distinct values
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.codes = array("l")
+        self.values = []
+        self.index = {}
+
+    def extend(self, values):
+        codes = []
+        for v in values:
+            code = self.index.get(v)
+            if code is None:
+                if len(self.values) >= self.max_size:
+                    raise OverflowError(self.max_size)
+                code = self.index[v] = len(self.values)
+                self.values.append(v)
+            codes.append(code)
+        self.codes.extend(codes)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def __iter__(self):
+        values = self.values
+        return (values[code] for code in self.codes)
+
+
+class ColumnBuilder(object):
+    def __init__(self, typecodes=default_typecodes, max_dictionary_size=1024):
+        self.typecodes = typecodes
+        self.max_dictionary_size = max_dictionary_size
+
+    def python_type(self, column):
+        try:
+            return column.type.python_type
+        except (AttributeError, NotImplementedError):
+            return None
+
+    def create(self, column):
+        python_type = self.python_type(column)
+        if python_type in self.typecodes:
+            return array(self.typecodes[python_type])
+        elif python_type is not None and issubclass(python_type, string_types):
+            return DictionaryColumn(max_size=self.max_dictionary_size)
+        return []
+
+    def extend(self, column, values):
+        """ extend column by values, and return it (or fallbacks to a list, if values are not storable)
+        """
+        size = len(column)
+        try:
+            column.extend(values)
+            return column
+        except (TypeError, OverflowError): # None, or too many distinct values
+            fallback = list(islice(column, size))
+            fallback.extend(values)
+            return fallback
+
+
+def as_columns(query, batch_size=1000, builder=None):
+    """ OrderedDict([(name, array or DictionaryColumn or list)]) filled from the db cursor
+    """
+    builder = builder or ColumnBuilder()
+    performed = perform(query)
+    projected = projection(performed)
+    statement = performed.with_entities(*[c for _, c in projected]).statement
+    columns = [builder.create(c) for _, c in projected]
+    for rows in fetch_batches(performed.session, statement, batch_size=batch_size):
+        for i, values in enumerate(zip(*rows)):
+            columns[i] = builder.extend(columns[i], values)
+    return OrderedDict(zip([name for name, _ in projected], columns))
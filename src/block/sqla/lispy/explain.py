@@ -0,0 +1,126 @@
+# -*- coding:utf-8 -*-
+import json
+import logging
+from timeit import default_timer
+from sqlalchemy.sql.expression import Executable, ClauseElement
+from sqlalchemy.ext.compiler import compiles
+from block.sqla.lispy import InvalidElement
+from block.sqla.lispy.reverse import create_reverse_handler, RenderContext
+logger = logging.getLogger(__name__)
+
+
+class Explain(Executable, ClauseElement):
+    """ EXPLAIN <statement>
+    """
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain)
+def compile_explain(explain, compiler, **kwargs):
+    return "EXPLAIN " + compiler.process(explain.statement, **kwargs)
+
+@compiles(Explain, "sqlite")
+def compile_sqlite_explain(explain, compiler, **kwargs):
+    return "EXPLAIN QUERY PLAN " + compiler.process(explain.statement, **kwargs)
+
+
+def _one_or_many(xs):
+    xs = list(xs)
+    if len(xs) == 1:
+        return xs[0]
+    return ["quote"] + xs
+
+def to_document(query, handler=None):
+    """ canonical query document of the query (macros expanded, lazy options applied).
+    queries with joins (relationship paths are joined as aliases), loader options ("load", "fields")
+    or distinct are not supported
+    """
+    handler = handler or create_reverse_handler()
+    context = RenderContext({})
+    if query._from_obj or query._join_entities:
+        raise InvalidElement("query with joins cannot be reversed. .. Explain")
+    if query._with_options or query._distinct:
+        raise InvalidElement("query with loader options or distinct cannot be reversed. .. Explain")
+    handle = lambda e: handler.handle(context, e)
+    data = {"query": [handle(d["expr"]) for d in query.column_descriptions]}
+    if query.whereclause is not None:
+        data["filter"] = handle(query.whereclause)
+    if query._order_by:
+        data["order_by"] = _one_or_many(handle(e) for e in query._order_by)
+    if query._group_by:
+        data["group_by"] = _one_or_many(handle(e) for e in query._group_by)
+    if query._having is not None:
+        data["having"] = handle(query._having)
+    if query._limit is not None:
+        data["limit"] = query._limit
+    if query._offset is not None:
+        data["offset"] = query._offset
+    return data
+
+
+class SlowQueryLog(object):
+    """ queries slower than threshold (seconds) are logged as json, in canonical query document form.
+    (if the query cannot be reversed, the macro expanded document is logged)
+    """
+    def __init__(self, threshold, logger=logger, handler=None):
+        self.threshold = threshold
+        self.logger = logger
+        self.handler = handler or create_reverse_handler()
+
+    def canonical(self, query, data=None):
+        try:
+            return to_document(query, handler=self.handler)
+        except Exception:
+            if data is None:
+                raise
+            return data
+
+    def record(self, query, elapsed, data=None):
+        if elapsed < self.threshold:
+            return None
+        entry = {"elapsed": elapsed, "query": self.canonical(query, data=data)}
+        self.logger.warning(json.dumps(entry, sort_keys=True, default=repr))
+        return entry
+
+
+class Explainer(object):
+    """ execute a query document. with {"explain": true}, returns the sql, params, the plan and timings (seconds)
+    instead of rows.
+
+    {"query": ":User", "filter": ["=", ":User.id", 1], "explain": true}
+    => {"sql": "SELECT ...", "params": {...}, "plan": [[...]], "rows": 1, "timings": {"parse": ..., "execute": ...}}
+    """
+    def __init__(self, parser, slow_log=None, explain_factory=Explain, timer=default_timer):
+        self.parser = parser
+        self.slow_log = slow_log
+        self.explain_factory = explain_factory
+        self.timer = timer
+
+    def explain(self, query):
+        session = query.session
+        statement = query.statement
+        compiled = statement.compile(bind=session.get_bind())
+        plan = session.execute(self.explain_factory(statement)).fetchall()
+        return {"sql": str(compiled), "params": compiled.params, "plan": [list(row) for row in plan]}
+
+    def __call__(self, data, session=None):
+        explain = data.get("explain", False)
+        data = self.parser.parse_macro({k: v for k, v in data.items() if k != "explain"})
+
+        start = self.timer()
+        query = self.parser(data)
+        if session is not None:
+            query = query.with_session(session)
+        query = query.perform()
+        parsed = self.timer()
+        rows = query.all()
+        executed = self.timer()
+
+        if self.slow_log is not None:
+            self.slow_log.record(query, executed - parsed, data=data)
+        if not explain:
+            return rows
+        result = self.explain(query)
+        result["rows"] = len(rows)
+        result["timings"] = {"parse": parsed - start, "execute": executed - parsed}
+        return result
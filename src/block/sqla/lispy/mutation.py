@@ -0,0 +1,213 @@
+# -*- coding:utf-8 -*-
+from itertools import islice, groupby
+from sqlalchemy.inspection import inspect
+from sqlalchemy.sql.dml import Insert
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm.evaluator import EvaluatorCompiler, UnevaluatableError
+from sqlalchemy.util import string_types
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.expression import ColumnClause
+from block.sqla.lispy import InvalidElement, is_column
+
+class UnsafeMutation(InvalidElement):
+    pass
+
+
+class SQLiteUpsert(Insert):
+    """ INSERT ... ON CONFLICT (index) DO UPDATE SET / DO NOTHING (sqlite >= 3.24)
+    """
+    def __init__(self, table, index_elements, set_=None, **kwargs):
+        super(SQLiteUpsert, self).__init__(table, **kwargs)
+        self.index_elements = index_elements
+        self.set_ = set_
+
+@compiles(SQLiteUpsert, "sqlite")
+def compile_sqlite_upsert(insert, compiler, **kwargs):
+    quote = lambda k: compiler.preparer.quote(insert.table.c[k].name)
+    text = compiler.visit_insert(insert, **kwargs)
+    text += " ON CONFLICT ({})".format(", ".join(quote(c) for c in insert.index_elements))
+    if not insert.set_:
+        return text + " DO NOTHING"
+    return text + " DO UPDATE SET {}".format(", ".join("{0} = excluded.{0}".format(quote(c)) for c in insert.set_))
+
+def postgresql_upsert(table, index_elements, set_=None):
+    from sqlalchemy.dialects.postgresql import insert
+    statement = insert(table)
+    if not set_:
+        return statement.on_conflict_do_nothing(index_elements=index_elements)
+    return statement.on_conflict_do_update(index_elements=index_elements,
+                                           set_={c: statement.excluded[c] for c in set_})
+
+default_upserts = {
+    "sqlite": SQLiteUpsert,
+    "postgresql": postgresql_upsert,
+}
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            break
+        yield chunk
+
+class Mutator(object):
+    """ set based update/delete, and bulk insert.
+
+    {"update": {"query": ":User", "set": {":User.active": False}, "filter": ["<", ":User.id", 10]}}
+    {"delete": {"query": ":User", "filter": ["<", ":User.id", 10]}}
+    {"insert": ":User", "rows": [{"name": "foo"}], "on_conflict": {"index": ["name"], "set": ["group_id"]}}
+
+    "query" can be omitted, if the set keys and the filter refer to one model only
+    ({"delete": {"filter": ["<", ":User.id", 10]}} is a delete of User).
+
+    synchronize_session="evaluate" falls back to "fetch", when the criteria (or the values) cannot be
+    evaluated in python (e.g. "in", that is an expanding bind parameter)
+    """
+    def __init__(self, parser, synchronize_session="evaluate", allow_empty_filter=False,
+                 session_factory=None, batch_size=1000, upserts=default_upserts):
+        self.parser = parser
+        self.synchronize_session = synchronize_session
+        self.allow_empty_filter = allow_empty_filter
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.upserts = upserts
+
+    def __call__(self, data):
+        if "update" in data:
+            return self.update(data["update"])
+        elif "delete" in data:
+            return self.delete(data["delete"])
+        elif "insert" in data:
+            return self.insert(data)
+        raise InvalidElement("mutation is not found: {}. .. Mutation".format(list(data.keys())))
+
+    def has_column_criteria(self, query):
+        """ the criteria refers to a column of the target (`1 = 1` doesn't)
+        """
+        if query.whereclause is None:
+            return False
+        tables = set(inspect(query.column_descriptions[0]["entity"]).tables)
+        return any(isinstance(e, ColumnClause) and e.table in tables
+                   for e in visitors.iterate(query.whereclause, {}))
+
+    def collect_models(self, data, models):
+        if hasattr(data, "keys"):
+            for k, v in data.items():
+                self.collect_models(k, models)
+                self.collect_models(v, models)
+        elif isinstance(data, (list, tuple)):
+            for e in data:
+                self.collect_models(e, models)
+        elif isinstance(data, string_types) and data.startswith(":"):
+            models.add(data.split(".", 1)[0])
+        return models
+
+    def infer_target(self, data):
+        """ ":User", the only model that is referred by the set keys and the filter
+        """
+        models = self.collect_models([data.get("set", {}), data.get("filter")], set())
+        if len(models) != 1:
+            raise InvalidElement("query is required (the target is ambiguous: {}). .. Mutation".format(sorted(models)))
+        return models.pop()
+
+    def build_query(self, data):
+        data = self.parser.parse_macro(data)
+        if "query" not in data:
+            data = dict(data, query=self.infer_target(data))
+        query = self.parser({k: v for k, v in data.items() if k != "set"}).perform()
+        if query._from_obj or query._join_entities:
+            raise InvalidElement("join (or relationship path) is not supported, use any/has. .. Mutation")
+        if query._limit is not None or query._offset is not None:
+            raise InvalidElement("limit/offset is not supported. .. Mutation")
+        if not self.allow_empty_filter and not self.has_column_criteria(query):
+            raise UnsafeMutation("filter (on a column of the target) is required. .. Mutation")
+        return query
+
+    def key_of(self, k, mapper):
+        """ ":User.name" or "name" => "name", an attribute of the mapper to be updated
+        """
+        e = self.parser.handler.handle(k)
+        if is_column(e) and mapper.isa(e.property.parent):
+            return e.key
+        elif isinstance(e, string_types) and not e.startswith(":"):
+            return e
+        raise InvalidElement("{} is not a column of {}. .. Mutation.update".format(k, mapper.class_.__name__))
+
+    def build_values(self, data, mapper):
+        try:
+            values = data["set"]
+        except KeyError:
+            raise InvalidElement("set is not found. .. Mutation")
+        columns = {prop.key: prop.key for prop in mapper.column_attrs}
+        parse_args = self.parser.parse_args
+        return {self.column_of(columns, self.key_of(k, mapper)): parse_args(v) for k, v in values.items()}
+
+    def synchronize_strategy(self, query, values=None):
+        if self.synchronize_session != "evaluate":
+            return self.synchronize_session
+        compiler = EvaluatorCompiler(query.column_descriptions[0]["entity"])
+        expressions = [query.whereclause] + list((values or {}).values())
+        try:
+            for e in expressions:
+                if hasattr(e, "__clause_element__") or hasattr(e, "_compiler_dispatch"):
+                    compiler.process(e)
+        except UnevaluatableError:
+            return "fetch"
+        return "evaluate"
+
+    def update(self, data):
+        """ returns the number of affected rows
+        """
+        query = self.build_query(data)
+        values = self.build_values(data, inspect(query.column_descriptions[0]["entity"]))
+        return query.update(values, synchronize_session=self.synchronize_strategy(query, values))
+
+    def delete(self, data):
+        """ returns the number of affected rows
+        """
+        query = self.build_query(data)
+        return query.delete(synchronize_session=self.synchronize_strategy(query))
+
+    def session(self):
+        if self.session_factory is not None:
+            return self.session_factory()
+        return self.parser.query_factory().session
+
+    def column_of(self, columns, k):
+        try:
+            return columns[k]
+        except KeyError:
+            raise InvalidElement("attribute {} is not found. .. Mutation.insert".format(k))
+
+    def build_insert(self, table, dialect, columns, on_conflict=None):
+        if not on_conflict:
+            return table.insert()
+        try:
+            upsert = self.upserts[dialect.name]
+        except KeyError:
+            raise InvalidElement("on_conflict is not supported on {}. .. Mutation".format(dialect.name))
+        index = [self.column_of(columns, k) for k in on_conflict.get("index", [])]
+        set_ = [self.column_of(columns, k) for k in on_conflict.get("set", [])]
+        return upsert(table, index, set_=set_)
+
+    def build_params(self, row, columns):
+        return {self.column_of(columns, k): v for k, v in row.items()}
+
+    def insert(self, data):
+        """ rows (list or iterator) are inserted by executemany, batch_size rows at a time.
+        returns the number of inserted rows
+        """
+        mapper = inspect(self.parser.handler.handle(data["insert"]))
+        columns = {prop.key: prop.columns[0].key for prop in mapper.column_attrs}
+        connection = self.session().connection()
+        statement = self.build_insert(mapper.local_table, connection.dialect, columns, data.get("on_conflict"))
+
+        count = 0
+        for chunk in chunked(data.get("rows", ()), self.batch_size):
+            params = [self.build_params(row, columns) for row in chunk]
+            for _, group in groupby(params, key=lambda p: sorted(p.keys())):
+                group = list(group)
+                rowcount = connection.execute(statement, group).rowcount
+                count += rowcount if rowcount >= 0 else len(group)
+        return count
@@ -0,0 +1,55 @@
+# -*- coding:utf-8 -*-
+import threading
+import warnings
+import sqlalchemy as sa
+
+class NPlusOneWarning(UserWarning):
+    pass
+
+class NPlusOneError(Exception):
+    pass
+
+def is_lazy_load(context):
+    # lazy loaders emit their query without eager loading (Query._invoke_all_eagers is False)
+    query = context.query
+    return getattr(query, "lazy_loaded_from", None) is not None or not query._invoke_all_eagers
+
+class LazyLoadCounter(object):
+    """ count lazy loads (in the current thread), and warn (or raise) if the count exceeds threshold
+
+    with LazyLoadCounter(Base, threshold=0, raise_error=True):
+        serialize(parser(data))
+
+    lazy loads that load no rows are not counted.
+    """
+    def __init__(self, base, threshold=0, raise_error=False):
+        self.base = base
+        self.threshold = threshold
+        self.raise_error = raise_error
+        self.contexts = set()
+        self.loaded = []
+        self.thread_id = None
+
+    @property
+    def count(self):
+        return len(self.contexts)
+
+    def on_load(self, target, context):
+        if threading.current_thread().ident != self.thread_id or not is_lazy_load(context):
+            return
+        if context not in self.contexts:
+            self.contexts.add(context)
+            self.loaded.append(target.__class__.__name__)
+
+    def __enter__(self):
+        self.thread_id = threading.current_thread().ident
+        sa.event.listen(self.base, "load", self.on_load, propagate=True)
+        return self
+
+    def __exit__(self, typ, value, tb):
+        sa.event.remove(self.base, "load", self.on_load)
+        if typ is None and self.count > self.threshold:
+            message = "{} lazy loads (threshold={}): {}".format(self.count, self.threshold, self.loaded)
+            if self.raise_error:
+                raise NPlusOneError(message)
+            warnings.warn(message, NPlusOneWarning)
@@ -0,0 +1,106 @@
+# -*- coding:utf-8 -*-
+import multiprocessing
+from collections import namedtuple
+from sqlalchemy.dialects import registry
+from sqlalchemy.sql import visitors, operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+
+CompiledStatement = namedtuple("CompiledStatement", "sql params")
+
+def create_dialect(name):
+    """ "sqlite", "postgresql", "mysql+pymysql", ...
+    """
+    return registry.load(name)()
+
+def _expand(e):
+    if (isinstance(e, BinaryExpression)
+            and isinstance(e.right, BindParameter) and e.right.expanding
+            and e.operator in (operators.in_op, operators.notin_op)):
+        values = e.right.value
+        if e.operator is operators.in_op:
+            return e.left.in_(values)
+        return e.left.notin_(values)
+    return None
+
+def expand_in_parameters(statement):
+    """ expanding bind parameters (of "in") are rendered as individual parameters, `x IN (?, ?, ?)`
+    """
+    return visitors.replacement_traverse(statement, {}, _expand)
+
+def compile_query(query, dialect):
+    """ CompiledStatement of (dialect specific sql text, bind parameters processed for the dbapi)
+    """
+    statement = expand_in_parameters(query.statement)
+    compiled = statement.compile(dialect=dialect)
+    params = compiled.construct_params()
+    processors = compiled._bind_processors
+    def process(k):
+        v = params[k]
+        return processors[k](v) if k in processors else v
+    if dialect.positional:
+        return CompiledStatement(str(compiled), tuple(process(k) for k in compiled.positiontup))
+    return CompiledStatement(str(compiled), {k: process(k) for k in params})
+
+def compile_document(parser, dialect, data):
+    return compile_query(parser(data).perform(), dialect)
+
+def execute_compiled(connection, compiled):
+    """ execute a precompiled statement (the sql text is given to the dbapi as it is)
+    """
+    return connection.execute(compiled.sql, compiled.params)
+
+
+## worker process state
+_parser = None
+_dialect = None
+
+def _initialize(parser_factory, dialect_name):
+    global _parser, _dialect
+    _parser = parser_factory()
+    _dialect = create_dialect(dialect_name)
+
+def _compile(data):
+    return compile_document(_parser, _dialect, data)
+
+class Precompiler(object):
+    """ parse and compile query documents in worker processes. the main process only executes the compiled statements.
+
+    parser_factory is called once in each worker process, so it should be picklable (a module level function)
+    and create a parser with a query_factory that doesn't bind a session, e.g. `lambda *args: orm.Query(args)`.
+    (operators that need a connection, e.g. TemporaryTableInOperator, cannot be used in workers)
+
+    with Precompiler(create_my_parser, "postgresql") as precompiler:
+        for compiled in precompiler.compile_all(documents):
+            rows = execute_compiled(connection, compiled).fetchall()
+    """
+    def __init__(self, parser_factory, dialect_name, processes=None, chunksize=64):
+        self.parser_factory = parser_factory
+        self.dialect_name = dialect_name
+        self.processes = processes
+        self.chunksize = chunksize
+        self.pool = None
+
+    def start(self):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes,
+                                             initializer=_initialize,
+                                             initargs=(self.parser_factory, self.dialect_name))
+        return self
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, typ, value, tb):
+        self.close()
+
+    def compile_all(self, documents):
+        """ CompiledStatement for each document, in order. documents are sent to workers chunksize at a time
+        """
+        self.start()
+        return self.pool.imap(_compile, documents, chunksize=self.chunksize)
@@ -4,10 +4,16 @@ logger = logging.getLogger(__name__)
 
 from sqlalchemy.inspection import inspect
 from sqlalchemy.exc import NoInspectionAvailable
+from sqlalchemy.sql.elements import Label, ClauseElement, BindParameter
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.orm.attributes import QueryableAttribute
+from sqlalchemy.util import LRUCache
 from block.sqla.lispy import (
     default_query_methods,
     default_lazy_options,
     default_args_method_table,
+    structural_key,
+    Uncacheable,
 )
 from collections import namedtuple, defaultdict
 Env = namedtuple("Env", "handler query_methods context_factory")
@@ -20,6 +26,8 @@ class MatchedClauesNotFound(Exception):
     pass
 
 class Name(object):
+    __slots__ = ("name",)
+
     def __init__(self, name):
         self.name = name
 
@@ -104,7 +112,14 @@ class ReverseHandler(object):
             if hasattr(m, "key") and hasattr(m, "class_"): #User.id
                 return ":{}".format(str(m))
             elif hasattr(m, "key") and hasattr(m, "value"): # User.id == 1 <- 
+                if getattr(m, "expanding", False) and isinstance(m.value, (list, tuple)): # User.id.in_([1, 2])
+                    return ["quote"] + list(m.value)
                 return self.handle(context, m.value)
+            elif isinstance(m, Label): # sa.func.count(User.id).label("n")
+                return ["label", self.scan(context, "1", m.element), m.name]
+            elif isinstance(m, FunctionElement): # sa.func.count(User.id)
+                args = [self.scan(context, str(i), x) for i, x in enumerate(m.clauses, 2)]
+                return ["fn", m.name] + args
             elif hasattr(m, "name") and hasattr(m, "_annotations"): # -> User.id == 1
                 return ":{}.{}".format(m._annotations["parententity"].class_.__name__, m.name)
             elif hasattr(m, "operator") and hasattr(m, "clauses"): # x & y,  x | y
@@ -126,7 +141,68 @@ class ReverseHandler(object):
         except NoInspectionAvailable:
             return e #1, 2, 3?
 
+def _value_key(v):
+    if isinstance(v, (list, tuple)):
+        return (type(v),) + tuple((type(e), _value_key(e)) for e in v)
+    elif isinstance(v, dict):
+        return tuple(sorted((k, _value_key(e)) for k, e in v.items()))
+    elif isinstance(v, Name):
+        raise Uncacheable(v)
+    hash(v)
+    return v
+
+def expression_key(e):
+    """ structural key of a sql expression, equal for expressions that are reversed to the same data.
+    an expression that has Name placeholders is Uncacheable
+    """
+    if isinstance(e, Name):
+        raise Uncacheable(e)
+    elif isinstance(e, type): # User
+        return (type, e)
+    elif isinstance(e, QueryableAttribute): # User.id
+        return (QueryableAttribute, e.class_, e.key)
+    elif isinstance(e, ClauseElement):
+        try:
+            attrs = [getattr(e, k, None) for k in ("operator", "modifier", "modifiers", "name")]
+            if isinstance(e, BindParameter): # the key of a bind parameter is anonymous
+                attrs.append((type(e.value), e.value)) # 1, 1.0 and True are distinguished
+            else:
+                attrs.append(getattr(e, "key", None))
+            parententity = e._annotations.get("parententity")
+            return (type(e), _value_key(attrs), parententity,
+                    tuple(expression_key(x) for x in e.get_children()))
+        except TypeError: # unhashable
+            raise Uncacheable(e)
+    return structural_key(e)
+
+class CachingReverseHandler(ReverseHandler):
+    """ memoize the result of each (sub) expression, keyed by expression_key.
+    expressions that have Name placeholders are not cached. results are shared, they must not be modified
+    """
+    def __init__(self, reverse_table, cache=None):
+        super(CachingReverseHandler, self).__init__(reverse_table)
+        self.cache = LRUCache(1000) if cache is None else cache
+        self.hits = 0
+        self.misses = 0
+
+    def handle(self, context, e):
+        try:
+            key = expression_key(e)
+        except Uncacheable:
+            return super(CachingReverseHandler, self).handle(context, e)
+        result = self.cache.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = self.cache[key] = super(CachingReverseHandler, self).handle(context, e)
+        return result
+
 class ReverseQuery(object):
+    """ immutable. data is never modified after construction, so nested data is shared (not copied)
+    """
+    __slots__ = ("env", "data")
+
     def __init__(self, env, data=None):
         self.env = env
         self.data = data or {} #tail
@@ -138,7 +214,7 @@ class ReverseQuery(object):
 
     def __getattr__(self, k):
         if k in self.env.query_methods:
-            return ArgsMethod(self.env, QueryMethod(k, self.data.copy()))
+            return ArgsMethod(self.env, QueryMethod(k, self.data))
         raise InvalidQueryMethod(k)
 
     def render(self, **kwargs):
@@ -155,6 +231,8 @@ class ReverseQuery(object):
         return context.action(context, self.data)
 
 class QueryTarget(object):
+    __slots__ = ("env", "args")
+
     def __init__(self, env, args):
         self.env = env
         self.args = args
@@ -165,6 +243,8 @@ class QueryTarget(object):
         return targets
 
 class QueryMethod(object):
+    __slots__ = ("name", "data", "args_method")
+
     def __init__(self, name, data, args=None):
         self.name = name
         self.data = data
@@ -174,16 +254,18 @@ class QueryMethod(object):
         if not self.name in self.data:
             new_data = self.data.copy()
         else:
-            new_data = {"query": self.data.copy()}
+            new_data = {"query": self.data}
         new_data[self.name] = args
         return ReverseQuery(args.env, new_data)
 
 
 class ArgsMethod(object):
+    __slots__ = ("env", "query_method", "args")
+
     def __init__(self, env, query_method, args=None):
         self.env = env
         self.query_method = query_method
-        self.args = None
+        self.args = args
 
     def __call__(self, args):
         self.args = args #xxx
@@ -202,6 +284,8 @@ class ReverseTable(object):
         "in_op": "in",
         "notin_op": "not_in",#xxx:
         "comma_op": "quote",#xxx:
+        "and_": "and",
+        "or_": "or",
     }
     def __init__(self, table, default=None):
         self.table = table
@@ -214,8 +298,12 @@ class ReverseTable(object):
             return self.default[k.__name__]
 
 
-def create_reverse_handler(reverse_table=None):
+def create_reverse_handler(reverse_table=None, cache=None):
+    """ cache is an LRUCache, results of the handler are memoized (CachingReverseHandler)
+    """
     reverse_table = reverse_table or ReverseTable({v:k for k, v in default_args_method_table.items()})
+    if cache is not None:
+        return CachingReverseHandler(reverse_table, cache=cache)
     return ReverseHandler(reverse_table)
 
 def create_env(reverse_handler=None, query_methods=None, context_factory=None):
@@ -0,0 +1,112 @@
+# -*- coding:utf-8 -*-
+import json
+from collections import OrderedDict
+from sqlalchemy.inspection import inspect
+
+def perform(query):
+    if hasattr(query, "perform"): # QueryProxy
+        return query.perform()
+    return query
+
+def loaded_columns(query):
+    """ columns that the query loads for its mapped entities (load_only/defer options are applied)
+    """
+    return set(query._compile_context().primary_columns)
+
+def projection(query):
+    """ [(name, column)] of the query's column projection (mapped entities are expanded into its loaded columns,
+    so "fields" and deferred columns, e.g. DeferHeavyColumns, are respected)
+    """
+    descriptions = query.column_descriptions
+    qualified = len(descriptions) > 1
+    loaded = None
+    result = []
+    for d in descriptions:
+        entity = d["entity"]
+        if entity is not None and d["expr"] is entity: # ":User"
+            if loaded is None:
+                loaded = loaded_columns(query)
+            info = inspect(entity)
+            for prop in info.mapper.column_attrs:
+                if info.selectable.corresponding_column(prop.columns[0]) not in loaded:
+                    continue
+                name = "{}.{}".format(d["name"], prop.key) if qualified else prop.key
+                result.append((name, getattr(entity, prop.key)))
+        else: # ":User.id"
+            result.append((d["name"], d["expr"]))
+
+    seen = set()
+    for i, (name, column) in enumerate(result):
+        if name in seen and hasattr(column, "class_"):
+            result[i] = ("{}.{}".format(column.class_.__name__, name), column)
+        seen.add(result[i][0])
+    return result
+
+def select_projection(query):
+    """ (names, statement), the statement selects only projected columns (no ORM entities)
+    """
+    query = perform(query)
+    columns = projection(query)
+    statement = query.with_entities(*[c for _, c in columns]).statement
+    return [name for name, _ in columns], statement
+
+def fetch_batches(session, statement, batch_size=1000):
+    """ rows from the db cursor, batch_size rows at a time
+    """
+    connection = session.connection().execution_options(stream_results=True)
+    result = connection.execute(statement)
+    try:
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        result.close()
+
+def _encoded(chunks, encoding):
+    if encoding is None:
+        return chunks
+    return (chunk.encode(encoding) for chunk in chunks)
+
+def _dump_rows(names, rows, default):
+    return [json.dumps(OrderedDict(zip(names, row)), default=default, separators=(",", ":"))
+            for row in rows]
+
+def dump_json(query, batch_size=1000, default=str, encoding=None):
+    """ ["[", '{"id":1,"name":"foo"},...', "]"] chunks, usable as a streaming response body
+    """
+    def generate():
+        performed = perform(query)
+        names, statement = select_projection(performed)
+        yield "["
+        sep = ""
+        for rows in fetch_batches(performed.session, statement, batch_size=batch_size):
+            yield sep + ",".join(_dump_rows(names, rows, default))
+            sep = ","
+        yield "]"
+    return _encoded(generate(), encoding)
+
+def dump_ndjson(query, batch_size=1000, default=str, encoding=None):
+    """ one json object per line
+    """
+    def generate():
+        performed = perform(query)
+        names, statement = select_projection(performed)
+        for rows in fetch_batches(performed.session, statement, batch_size=batch_size):
+            yield "\n".join(_dump_rows(names, rows, default)) + "\n"
+    return _encoded(generate(), encoding)
+
+def dump_columnar(query, **kwargs):
+    from block.sqla.lispy.columnar import as_columns
+    return as_columns(query, **kwargs)
+
+
+default_formats = {
+    "json": dump_json,
+    "ndjson": dump_ndjson,
+    "columnar": dump_columnar,
+}
+
+def dump(query, format="json", formats=default_formats, **kwargs):
+    return formats[format](query, **kwargs)
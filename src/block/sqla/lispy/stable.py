@@ -0,0 +1,71 @@
+# -*- coding:utf-8 -*-
+import sqlalchemy as sa
+from collections import Counter, defaultdict
+from sqlalchemy.util import string_types
+from block.sqla.lispy import default_args_method_table, is_literal, InOperator
+
+default_comparison_methods = ["<", "<=", ">", ">=", "=", "!=", "like", "notlike"]
+
+def bind_literal(e, type_=None):
+    if e is None or not is_literal(e): # `x = NULL` is `x IS NULL`, it is another shape
+        return e
+    return sa.bindparam("literal", e, type_=type_, unique=True)
+
+def bind_literals(fn):
+    """ literal operands are always bound as typed parameters. (e.g. `active = true` => `active = ?`)
+    """
+    def wrapped(x, *args):
+        type_ = getattr(x, "type", None)
+        return fn(bind_literal(x), *[bind_literal(e, type_=type_) for e in args])
+    wrapped.__name__ = getattr(fn, "__name__", "wrapped")
+    return wrapped
+
+def create_stable_args_method_table(args_method_table=default_args_method_table,
+                                    comparison_methods=default_comparison_methods):
+    """ args_method_table for a parser that generates one sql text per query shape
+    (in-lists are bound as one expanding parameter, never chunked, and limit/offset as parameters by sqlalchemy)
+    """
+    table = args_method_table.copy()
+    if type(table.get("in")) is InOperator:
+        table["in"] = InOperator(chunk_size=None)
+    for name in comparison_methods:
+        table[name] = bind_literals(table[name])
+    return table
+
+
+def shape_of(data):
+    """ a document without literal values. ":Model.attr" tokens and method names are kept.
+    """
+    if hasattr(data, "keys"):
+        return tuple((k, shape_of(data[k])) for k in sorted(data.keys()))
+    elif isinstance(data, (list, tuple)):
+        if not data:
+            return ()
+        head, args = data[0], [shape_of(e) for e in data[1:]]
+        if not isinstance(head, string_types): # e.g. [["fn", "count", ":User.id"]]
+            head = shape_of(head)
+        if head == "quote": # the length of in-list is not a part of the shape
+            return (head, tuple(sorted(set(args), key=repr)))
+        return (head,) + tuple(args)
+    elif isinstance(data, string_types) and data.startswith(":"):
+        return data
+    return type(data).__name__
+
+def sql_text_report(parser, documents, dialect=None):
+    """ how many distinct sql texts are generated by documents (per query shape)
+    """
+    texts = Counter()
+    shapes = defaultdict(set)
+    for data in documents:
+        data = parser.parse_macro(data)
+        statement = parser.parse(data).perform().statement
+        text = str(statement.compile(dialect=dialect))
+        texts[text] += 1
+        shapes[shape_of(data)].add(text)
+    return {
+        "documents": sum(texts.values()),
+        "shapes": len(shapes),
+        "sql_texts": len(texts),
+        "unstable_shapes": [shape for shape, xs in shapes.items() if len(xs) > 1],
+        "texts": texts,
+    }
@@ -0,0 +1,120 @@
+# -*- coding:utf-8 -*-
+import sqlalchemy as sa
+from sqlalchemy.sql import visitors
+from block.sqla.lispy import InvalidElement
+from block.sqla.lispy.reverse import ReverseQuery
+
+class TemplateNotFound(InvalidElement):
+    pass
+
+class InvalidParameter(InvalidElement):
+    pass
+
+def collect_bindparams(statement, names):
+    """ {name: BindParameter} for each placeholder name found in statement
+    """
+    found = {}
+    def visit_bindparam(bindparam):
+        if bindparam.key in names:
+            found.setdefault(bindparam.key, []).append(bindparam)
+    visitors.traverse(statement, {}, {"bindparam": visit_bindparam})
+    return found
+
+def required_bindparams(statement):
+    """ names of the bind parameters that have no value
+    """
+    names = set()
+    def visit_bindparam(bindparam):
+        if bindparam.required:
+            names.add(bindparam.key)
+    visitors.traverse(statement, {}, {"bindparam": visit_bindparam})
+    return names
+
+def python_types_of(bindparams):
+    types = []
+    for bindparam in bindparams:
+        try:
+            types.append(bindparam.type.python_type)
+        except NotImplementedError: # NullType, e.g. limit(Name("limit"))
+            pass
+    return tuple(types)
+
+
+class Template(object):
+    def __init__(self, name, query, names):
+        self.name = name
+        self.query = query
+        self.names = frozenset(names)
+        self.statement = query.statement
+        bindparams = collect_bindparams(self.statement, self.names)
+        self.types = {k: python_types_of(bs) for k, bs in bindparams.items()}
+        self.expanding = frozenset(k for k, bs in bindparams.items() if any(b.expanding for b in bs)) # "in"
+        self.compiled_cache = {}
+
+    def check_params(self, params):
+        unknown = set(params.keys()).difference(self.names)
+        if unknown:
+            raise InvalidParameter("unknown parameter {} .. {}".format(sorted(unknown), self.name))
+        missing = self.names.difference(params.keys())
+        if missing:
+            raise InvalidParameter("missing parameter {} .. {}".format(sorted(missing), self.name))
+        for k, v in params.items():
+            if k in self.expanding:
+                if not isinstance(v, (list, tuple)):
+                    raise InvalidParameter("{}={!r} is not list .. {}".format(k, v, self.name))
+                values = v
+            else:
+                values = [v]
+            for python_type in self.types.get(k, ()):
+                for x in values:
+                    if x is not None and not isinstance(x, python_type):
+                        raise InvalidParameter("{}={!r} is not {} .. {}".format(k, x, python_type.__name__, self.name))
+        return params
+
+    def __call__(self, params, session=None):
+        query = self.query
+        if session is not None:
+            query = query.with_session(session)
+        return query.params(**self.check_params(params))
+
+    def execute(self, params, session=None):
+        """ execute the precompiled statement directly (rows, not mapped objects)
+        """
+        session = session or self.query.session
+        connection = session.connection().execution_options(compiled_cache=self.compiled_cache)
+        return connection.execute(self.statement, self.check_params(params))
+
+
+class TemplateRegistry(object):
+    """ {"template": "users_by_group", "params": {"group_id": 1}}
+
+    a template is a ReverseQuery with Name placeholders, or a query document (macros are expanded
+    at registration, sa.bindparam(name) in the document or in the expansion are the parameters)
+    """
+    def __init__(self, parser, template_factory=Template):
+        self.parser = parser
+        self.template_factory = template_factory
+        self.templates = {}
+
+    def register(self, name, reverse_query):
+        if isinstance(reverse_query, ReverseQuery):
+            names = list(reverse_query.collect().keys())
+            data = reverse_query.render(**{k: sa.bindparam(k) for k in names})
+            query = self.parser(data).perform()
+        else:
+            query = self.parser(reverse_query).perform()
+            names = required_bindparams(query.statement)
+        template = self.templates[name] = self.template_factory(name, query, names)
+        return template
+
+    def lookup(self, data):
+        try:
+            return self.templates[data["template"]]
+        except KeyError:
+            raise TemplateNotFound("{} is not found. .. Template".format(data.get("template")))
+
+    def __call__(self, data, session=None):
+        return self.lookup(data)(data.get("params") or {}, session=session)
+
+    def execute(self, data, session=None):
+        return self.lookup(data).execute(data.get("params") or {}, session=session)
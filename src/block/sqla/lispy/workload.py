@@ -0,0 +1,175 @@
+# -*- coding:utf-8 -*-
+import json
+import random
+from random import Random
+import tempfile
+import threading
+import time
+from timeit import default_timer
+from concurrent.futures import ThreadPoolExecutor
+import sqlalchemy as sa
+
+## capture
+
+def dump_document(data):
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+class Recorder(object):
+    """ samples (macro expanded) query documents into a json lines file, then parses them
+
+    recorder = Recorder(parser, open("workload.jsonl", "a"), rate=0.01)
+    query = recorder(data)
+
+    sampling never fails the request. documents that are not json serializable (e.g. a bind parameter
+    emitted by a macro) are skipped, and counted by skipped (failed writes by errors).
+    """
+    def __init__(self, parser, fp, rate=1.0, random=random.random):
+        self.parser = parser
+        self.fp = fp
+        self.rate = rate
+        self.random = random
+        self.lock = threading.Lock()
+        self.skipped = 0
+        self.errors = 0
+
+    def record(self, data):
+        if self.random() >= self.rate:
+            return False
+        try:
+            line = dump_document(data) + "\n"
+        except (TypeError, ValueError):
+            self.skipped += 1
+            return False
+        with self.lock: # only sampled documents take the lock
+            try:
+                self.fp.write(line)
+            except (IOError, OSError, ValueError): # ValueError: the file is closed
+                self.errors += 1
+                return False
+        return True
+
+    def __call__(self, data, query=None):
+        data = self.parser.parse_macro(data)
+        self.record(data)
+        return self.parser(data, query=query)
+
+def load_documents(fp):
+    for line in fp:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+## replay
+
+def create_sqlite_copy(base, path=None):
+    """ an engine of a sqlite database (a temporary file by default) that has the tables of base
+    """
+    if path is None:
+        path = tempfile.NamedTemporaryFile(suffix=".sqlite", delete=False).name
+    engine = sa.create_engine("sqlite:///{}".format(path))
+    base.metadata.create_all(engine)
+    return engine
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    i = int(round(p / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[i]
+
+def cache_stats(cache):
+    if cache is None:
+        return None
+    total = cache.hits + cache.misses
+    return {"hits": cache.hits, "misses": cache.misses, "hit_rate": cache.hits / float(total) if total else None}
+
+def replay(parser, documents, session_factory, threads=4, rate=None, timer=default_timer, sleep=time.sleep):
+    """ execute documents with parser in a thread pool, at most rate documents per second (None means no limit).
+    returns a report of throughput (documents/second), latency percentiles (seconds), errors and cache hits.
+
+    the parser should be created with a query_factory that doesn't bind a session (the query is executed
+    with a session of session_factory)
+    """
+    def run(data):
+        session = session_factory()
+        try:
+            start = timer()
+            parser(data).with_session(session).all()
+            return timer() - start
+        finally:
+            session.close()
+
+    latencies = []
+    errors = []
+    started = timer()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = []
+        for i, data in enumerate(documents):
+            if rate is not None:
+                delay = started + i / float(rate) - timer()
+                if delay > 0:
+                    sleep(delay)
+            futures.append(executor.submit(run, data))
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors.append(repr(e))
+    elapsed = timer() - started
+
+    latencies.sort()
+    count = len(latencies) + len(errors)
+    return {
+        "documents": count,
+        "errors": errors,
+        "elapsed": elapsed,
+        "throughput": count / elapsed if elapsed > 0 else None,
+        "latency": {"p50": percentile(latencies, 50),
+                    "p90": percentile(latencies, 90),
+                    "p99": percentile(latencies, 99),
+                    "max": latencies[-1] if latencies else None},
+        "cache": cache_stats(getattr(parser, "cache", None)),
+    }
+
+
+## synthetic workload
+
+def mapped_classes(base):
+    return sorted((cls for name, cls in base._decl_class_registry.items() if isinstance(cls, type)),
+                  key=lambda cls: cls.__name__)
+
+def generate_filter(name, column, random):
+    token = ":{}".format(name)
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return None
+    if python_type is bool:
+        return ["=", token, random.choice([True, False])]
+    elif issubclass(python_type, int):
+        return [random.choice(["=", "<", ">"]), token, random.randint(1, 100)]
+    elif python_type is str:
+        return ["like", token, "{}%".format(random.choice("abcdefghijklmnopqrstuvwxyz"))]
+    return None
+
+def generate_documents(base, n, seed=0, max_limit=100):
+    """ n synthetic query documents, filters and limits over the mapped classes of base
+    """
+    random = Random(seed)
+    candidates = []
+    for cls in mapped_classes(base):
+        mapper = sa.inspect(cls)
+        columns = [("{}.{}".format(cls.__name__, prop.key), prop.columns[0]) for prop in mapper.column_attrs]
+        order_by = ":{}.{}".format(cls.__name__, mapper.get_property_by_column(mapper.primary_key[0]).key)
+        candidates.append((cls.__name__, columns, order_by))
+
+    for _ in range(n):
+        name, columns, order_by = random.choice(candidates)
+        data = {"query": ":{}".format(name), "order_by": order_by, "limit": random.randint(1, max_limit)}
+        filters = [f for f in (generate_filter(k, c, random) for k, c in random.sample(columns, min(2, len(columns))))
+                   if f is not None]
+        if len(filters) == 1:
+            data["filter"] = filters[0]
+        elif filters:
+            data["filter"] = ["and"] + filters
+        yield data
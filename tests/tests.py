@@ -53,6 +53,30 @@ class MapperHandlerTests(unittest.TestCase):
         with self.assertRaises(InvalidElement):
             target.handle(":User.id__")
 
+    def test_handle_relationship_path(self):
+        from block.sqla.lispy import RelationshipPath
+        Base = declarative_base()
+        class Group(Base):
+            __tablename__ = "groups"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            group_id = sa.Column(sa.Integer(), sa.ForeignKey("groups.id"))
+            group = orm.relationship(Group, uselist=False, backref=("users"))
+
+        target = self._makeOne(Base)
+        self.assertIs(target.handle(":User.group"), User.group)
+
+        result = target.handle(":User.group.name")
+        self.assertIsInstance(result, RelationshipPath)
+        self.assertEqual(len(result.relationships), 1)
+        self.assertIs(result.relationships[0], User.group)
+        self.assertIs(result.attribute, Group.name)
+        self.assertEqual(result.key, (User, ("group",)))
+
 
 class DefailtCompositeHandlerTests(unittest.TestCase):
     def _getTarget(self):
@@ -145,6 +169,9 @@ class ApplicableTests(unittest.TestCase):
     def assertQuery(self, q1, q2):
         self.assertEqual(str(q1), str(q2))
 
+    def _expanding(self, values):
+        return sa.bindparam("in_values", values, expanding=True, unique=True)
+
     def test_0(self):
         data = {"query": self.User,
                 "filter": ["=", self.User.id, 1]}
@@ -163,14 +190,14 @@ class ApplicableTests(unittest.TestCase):
         data = {"query": self.User,
                 "filter": ["in", self.User.id, ["quote", 1, 2, 3]]}
         result = self._callFUT(data).perform()
-        expected = self.Session.query(self.User).filter(self.User.id.in_([1, 2, 3]))
+        expected = self.Session.query(self.User).filter(self.User.id.in_(self._expanding([1, 2, 3])))
         self.assertQuery(result, expected)
 
     def test_3(self):
         data = {"query": self.User,
                 "filter": ["not", ["in", self.User.id, ["quote", 1, 2, 3]]]}
         result = self._callFUT(data).perform()
-        expected = self.Session.query(self.User).filter(sa.not_(self.User.id.in_([1, 2, 3])))
+        expected = self.Session.query(self.User).filter(sa.not_(self.User.id.in_(self._expanding([1, 2, 3]))))
         self.assertQuery(result, expected)
 
     def test_4(self):
@@ -330,5 +357,243 @@ class ApplicableTests(unittest.TestCase):
         expected = q.join(self.User).order_by(sa.desc(self.User.id)).limit(10)
         self.assertQuery(result, expected)
 
+    def test_18__group_by(self):
+        data = {"query": [self.User.group_id, ["label", ["fn", "count", self.User.id], "n"]],
+                "group_by": self.User.group_id,
+                "having": [">", ["fn", "count", self.User.id], 1],
+                "order_by": ["desc", "n"]}
+        result = self._callFUT(data).perform()
+        q = self.Session.query(self.User.group_id, sa.func.count(self.User.id).label("n"))
+        q = q.order_by(sa.desc("n")).group_by(self.User.group_id)
+        expected = q.having(sa.func.count(self.User.id) > 1)
+        self.assertQuery(result, expected)
+
+    def test_19__function_not_allowed(self):
+        from block.sqla.lispy import InvalidElement
+        data = {"query": self.User,
+                "filter": ["=", ["fn", "pg_sleep", 10], 1]}
+        with self.assertRaises(InvalidElement):
+            self._callFUT(data)
+
+class StructuralKeyTests(unittest.TestCase):
+    def _callFUT(self, data):
+        from block.sqla.lispy import structural_key
+        return structural_key(data)
+
+    def test_it(self):
+        data1 = {"query": ":User", "filter": ["=", ":User.id", 1]}
+        data2 = {"filter": ["=", ":User.id", 1], "query": ":User"}
+        self.assertEqual(self._callFUT(data1), self._callFUT(data2))
+
+    def test_literal_types_are_distinguished(self):
+        keys = set(self._callFUT(["=", ":User.id", v]) for v in [1, 1.0, True, "1"])
+        self.assertEqual(len(keys), 4)
+
+    def test_uncacheable(self):
+        from block.sqla.lispy import Uncacheable
+        with self.assertRaises(Uncacheable):
+            self._callFUT({"query": object()})
+
+class CachedParserTests(unittest.TestCase):
+    def setUp(self):
+        Base = declarative_base()
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        self.Base = Base
+        self.User = User
+        self.Session = orm.sessionmaker()()
+
+    def _makeOne(self):
+        from block.sqla.lispy import create_parser, QueryCache
+        return create_parser(self.Base, lambda *args: orm.Query(args), cache=QueryCache())
+
+    def assertQuery(self, q1, q2):
+        self.assertEqual(str(q1), str(q2))
+
+    def test_extends_cached_prefix(self):
+        target = self._makeOne()
+        base = {"query": ":User", "filter": ["like", ":User.name", "foo%"]}
+        target(base)
+        self.assertEqual((target.cache.hits, target.cache.misses), (0, 1))
+
+        result = target({"query": base, "filter": ["<", ":User.id", 10], "limit": 10}).perform()
+        self.assertEqual((target.cache.hits, target.cache.misses), (1, 2))
+
+        q = self.Session.query(self.User).filter(self.User.name.like("foo%"))
+        expected = q.filter(self.User.id < 10).limit(10)
+        self.assertQuery(result, expected)
+
+    def test_cached_query_is_not_modified(self):
+        target = self._makeOne()
+        base = {"query": ":User", "filter": ["like", ":User.name", "foo%"]}
+        target({"query": base, "limit": 10})
+        result = target(base).perform()
+        expected = self.Session.query(self.User).filter(self.User.name.like("foo%"))
+        self.assertQuery(result, expected)
+
+    def test_with_session(self):
+        target = self._makeOne()
+        result = target({"query": ":User", "limit": 10}).with_session(self.Session)
+        self.assertEqual(result.perform().session, self.Session)
+
+    def test_scoped_session(self):
+        from block.sqla.lispy import create_parser, QueryCache
+        Session = orm.scoped_session(orm.sessionmaker())
+        target = create_parser(self.Base, Session.query, cache=QueryCache())
+        data = {"query": ":User", "limit": 10}
+        s1 = Session()
+        self.assertIs(target(data).perform().session, s1)
+        Session.remove()
+        s2 = Session()
+        result = target(data).perform()
+        self.assertEqual(target.cache.hits, 1)
+        self.assertIsNot(s1, s2)
+        self.assertIs(result.session, s2)
+        self.assertIsNone(target.cache.queries[target.cache.key(data)].session)
+
+    def test_method_wrapper_is_cached(self):
+        from block.sqla.lispy import QueryProxy
+        q1 = QueryProxy(orm.Query(self.User))
+        q2 = q1.filter(self.User.id == 1)
+        self.assertIs(q1.filter.__func__, q2.filter.__func__)
+        self.assertEqual(q1.filter.__name__, "filter")
+
+class MacroRegistryTests(unittest.TestCase):
+    def setUp(self):
+        Base = declarative_base()
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            tenant_id = sa.Column(sa.Integer(), nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        self.Base = Base
+        self.User = User
+        self.calls = []
+
+    def _makeOne(self, *args, **kwargs):
+        from block.sqla.lispy import MacroRegistry
+        return MacroRegistry(*args, **kwargs)
+
+    def _search(self, word):
+        self.calls.append(word)
+        return {"filter": ["like", ":User.name", "%{}%".format(word)]}
+
+    def test_default_macros(self):
+        from block.sqla.lispy import default_macros, cascade
+        target = self._makeOne(default_macros)
+        self.assertIs(target["cascade"], cascade)
+        self.assertIn("cascade", target)
+
+    def test_not_found(self):
+        from block.sqla.lispy import InvalidElement
+        target = self._makeOne({})
+        with self.assertRaises(InvalidElement):
+            target["search"]
+
+    def test_pure(self):
+        target = self._makeOne(capacity=10)
+        target.register("search", self._search, pure=True)
+        self.assertIs(target["search"]("foo"), target["search"]("foo"))
+        target["search"]("bar")
+        self.assertEqual(self.calls, ["foo", "bar"])
+
+    def test_not_pure(self):
+        target = self._makeOne()
+        target.register("search", self._search)
+        target["search"]("foo")
+        target["search"]("foo")
+        self.assertEqual(self.calls, ["foo", "foo"])
+
+    def test_parser(self):
+        from block.sqla.lispy import create_parser, QueryCache
+        target = self._makeOne()
+        target.register("search", self._search, pure=True)
+        target.register("tenant_scope", lambda _: {"filter": ["=", ":User.tenant_id", sa.bindparam("tenant_id")]}, pure=True)
+        parser = create_parser(self.Base, lambda *args: orm.Query(args), macros=target, cache=QueryCache())
+        data = {"@cascade": [{"query": ":User", "@tenant_scope": True}, {"@search": "foo"}]}
+
+        result = parser(data).perform()
+        parser(data).perform()
+        self.assertEqual(self.calls, ["foo"])
+        self.assertEqual(parser.cache.hits, 1) # bind parameter of the tenant is cacheable
+
+        q = orm.Query(self.User).filter(self.User.tenant_id == sa.bindparam("tenant_id"))
+        expected = q.filter(self.User.name.like("%foo%"))
+        self.assertEqual(str(result), str(expected))
+        self.assertEqual(result.params(tenant_id=1).statement.compile().params["tenant_id"], 1)
+
+class ThreadSafetyTests(unittest.TestCase):
+    def setUp(self):
+        Base = declarative_base()
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        self.Base = Base
+        self.User = User
+
+    def _makeOne(self, **kwargs):
+        from block.sqla.lispy import create_parser
+        return create_parser(self.Base, lambda *args: orm.Query(args), **kwargs)
+
+    def _compile(self, query):
+        compiled = query.perform().statement.compile()
+        return str(compiled), compiled.params
+
+    def test_parse_macro__not_modified(self):
+        import copy
+        target = self._makeOne()
+        data = {"query": {"@cascade": [{"query": ":User"}, {"filter": ["=", ":User.id", 1]}]},
+                "@cascade": [{"limit": 20}, {"limit": 10}]}
+        copied = copy.deepcopy(data)
+        target(data)
+        target(data)
+        self.assertEqual(data, copied)
+
+    def test_insert_bottom__not_modified(self):
+        from block.sqla.lispy import insert_bottom
+        data = {"query": {"filter": ["=", ":User.id", 1]}}
+        result = insert_bottom(data, ":User")
+        self.assertEqual(result, {"query": {"query": ":User", "filter": ["=", ":User.id", 1]}})
+        self.assertEqual(data, {"query": {"filter": ["=", ":User.id", 1]}})
+
+    def test_limit_and_offset(self):
+        target = self._makeOne()
+        result = target({"query": ":User", "limit": 10, "offset": 5}).perform()
+        self.assertEqual((result._limit, result._offset), (10, 5))
+
+    def test_concurrent(self):
+        import threading
+        from block.sqla.lispy import QueryCache
+        target = self._makeOne(cache=QueryCache(capacity=10))
+        base = {"query": ":User", "filter": ["like", ":User.name", "foo%"]}
+
+        def document(i):
+            return {"query": base, "filter": ["=", ":User.id", i % 20], "limit": i, "offset": i % 7}
+
+        expected = {i: self._compile(self._makeOne()(document(i))) for i in range(100)}
+        errors = []
+
+        def run():
+            try:
+                for _ in range(5):
+                    for i in range(100):
+                        if self._compile(target(document(i))) != expected[i]:
+                            errors.append(i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding:utf-8 -*-
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.declarative import declarative_base
+import unittest
+
+class UnionBatcherTests(unittest.TestCase):
+    def setUp(self):
+        from block.sqla.lispy import create_parser
+
+        engine = sa.create_engine("sqlite://")
+        Base = declarative_base()
+        class Group(Base):
+            __tablename__ = "groups"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            group_id = sa.Column(sa.Integer(), sa.ForeignKey("groups.id"))
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        Base.metadata.create_all(engine)
+        self.User = User
+        self.Group = Group
+        self.Session = orm.sessionmaker(bind=engine)()
+        self.parser = create_parser(Base, lambda *args: orm.Query(args))
+
+        group1 = Group(name="Group1")
+        group2 = Group(name="Group2")
+        self.Session.add_all([group1, group2])
+        self.Session.flush()
+        self.Session.add_all([User(name="foo", group_id=group1.id),
+                              User(name="boo", group_id=group1.id),
+                              User(name="bar", group_id=group2.id)])
+        self.Session.commit()
+
+        self.statements = []
+        def before_cursor_execute(conn, cursor, statement, *args):
+            self.statements.append(statement)
+        sa.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+
+    def _makeOne(self, *args, **kwargs):
+        from block.sqla.lispy.batch import UnionBatcher
+        return UnionBatcher(self.parser, *args, **kwargs)
+
+    def test_counts(self):
+        target = self._makeOne()
+        documents = [{"query": [["fn", "count", ":User.id"]], "filter": ["=", ":User.group_id", i]} for i in [1, 2, 3]]
+        result = target(documents, session=self.Session)
+        self.assertEqual(result, [[(2,)], [(1,)], [(0,)]])
+        self.assertEqual(len(self.statements), 1)
+        self.assertIn("UNION ALL", self.statements[0])
+
+    def test_columns(self):
+        target = self._makeOne()
+        documents = [{"query": [":User.id", ":User.name"], "filter": ["=", ":User.group_id", i]} for i in [2, 1]]
+        result = target(documents, session=self.Session)
+        self.assertEqual([sorted(rows) for rows in result], [[(3, "bar")], [(1, "foo"), (2, "boo")]])
+        self.assertEqual(len(self.statements), 1)
+
+    def test_entities_and_other_shapes(self):
+        target = self._makeOne()
+        documents = [
+            {"query": ":User", "filter": ["=", ":User.name", "foo"]},
+            {"query": ":Group", "filter": ["=", ":Group.name", "Group2"]},
+            {"query": ":User", "filter": ["=", ":User.name", "bar"]},
+        ]
+        result = target(documents, session=self.Session)
+        self.assertEqual([[e.name for e in rows] for rows in result], [["foo"], ["Group2"], ["bar"]])
+        self.assertEqual(len(self.statements), 2)
+
+    def test_unbatchable(self):
+        target = self._makeOne()
+        documents = [{"query": ":User.name", "filter": ["=", ":User.group_id", i], "order_by": ":User.id"} for i in [1, 2]]
+        result = target(documents, session=self.Session)
+        self.assertEqual(result, [[("foo",), ("boo",)], [("bar",)]])
+        self.assertEqual(len(self.statements), 2)
+        self.assertNotIn("UNION ALL", self.statements[0])
+
+if __name__ == '__main__':
+    unittest.main()
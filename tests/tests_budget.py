@@ -0,0 +1,122 @@
+# -*- coding:utf-8 -*-
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.declarative import declarative_base
+import unittest
+
+class BudgetTests(unittest.TestCase):
+    def _makeOne(self, *args, **kwargs):
+        from block.sqla.lispy.budget import Budget
+        return Budget(*args, **kwargs)
+
+    def assertExceeded(self, target, data, limit):
+        from block.sqla.lispy.budget import BudgetExceeded
+        with self.assertRaises(BudgetExceeded) as c:
+            target.check(data)
+        self.assertEqual(c.exception.limit, limit)
+        return c.exception
+
+    def test_unlimited(self):
+        target = self._makeOne()
+        data = {"query": ":User", "filter": ["in", ":User.id", list(range(1000))]}
+        self.assertEqual(target.check(data), data)
+
+    def test_nodes(self):
+        target = self._makeOne(max_nodes=6)
+        target.check({"query": ":User", "filter": ["=", ":User.id", 1]})
+        self.assertExceeded(target, {"query": ":User", "filter": ["and", ["=", ":User.id", 1], ["=", ":User.id", 2]]}, "nodes")
+
+    def test_depth(self):
+        target = self._makeOne(max_depth=3)
+        data = {"query": {"query": {"query": ":User"}}}
+        error = self.assertExceeded(target, data, "depth")
+        self.assertEqual(error.as_dict(), {"limit": "depth", "value": 4, "maximum": 3})
+
+    def test_joins(self):
+        target = self._makeOne(max_joins=1)
+        target.check({"query": ":User", "filter": ["=", ":User.group.name", "foo"], "order_by": ":User.group.id"})
+        data = {"query": ":User", "filter": ["=", ":User.group.name", "foo"], "join": ":Group"}
+        self.assertExceeded(target, data, "joins")
+
+    def test_in_size(self):
+        target = self._makeOne(max_in_size=3)
+        target.check({"query": ":User", "filter": ["in", ":User.id", ["quote", 1, 2, 3]]})
+        data = {"query": ":User", "filter": ["not", ["in", ":User.id", [1, 2, 3, 4]]]}
+        self.assertExceeded(target, data, "in_size")
+
+    def test_limit(self):
+        target = self._makeOne(max_limit=100)
+        target.check({"query": ":User", "limit": 100})
+        self.assertExceeded(target, {"query": {"query": ":User", "limit": ["quote", 1000]}}, "limit")
+        self.assertExceeded(target, {"query": ":User", "limit": "100000"}, "limit")
+        self.assertExceeded(target, {"query": ":User", "limit": 1e6}, "limit")
+
+    def test_limit__not_integer(self):
+        from block.sqla.lispy import InvalidElement
+        target = self._makeOne(max_limit=100)
+        with self.assertRaises(InvalidElement):
+            target.check({"query": ":User", "limit": "many"})
+        with self.assertRaises(InvalidElement):
+            target.check({"query": ":User", "limit": None})
+
+
+class ParserBudgetTests(unittest.TestCase):
+    def setUp(self):
+        from block.sqla.lispy.budget import install_statement_timeout
+        engine = sa.create_engine("sqlite://")
+        install_statement_timeout(engine)
+        Base = declarative_base()
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        Base.metadata.create_all(engine)
+        self.engine = engine
+        self.Base = Base
+        self.User = User
+        self.Session = orm.sessionmaker(bind=engine)()
+
+    def _makeOne(self, *args, **kwargs):
+        from block.sqla.lispy import create_parser
+        return create_parser(self.Base, self.Session.query, *args, **kwargs)
+
+    def test_budget(self):
+        from block.sqla.lispy.budget import Budget, BudgetExceeded
+        target = self._makeOne(budget=Budget(max_limit=100))
+        target({"@cascade": [{"query": ":User"}, {"limit": 100}]})
+        with self.assertRaises(BudgetExceeded):
+            target({"@cascade": [{"query": ":User"}, {"limit": 101}]})
+
+    def test_budget__deeper_than_recursion_limit(self):
+        import sys
+        from block.sqla.lispy.budget import Budget, BudgetExceeded
+        target = self._makeOne(budget=Budget(max_depth=20))
+        data = ["=", ":User.id", 1]
+        for _ in range(sys.getrecursionlimit() + 100):
+            data = ["not", data]
+        with self.assertRaises(BudgetExceeded) as c:
+            target({"query": ":User", "filter": data})
+        self.assertEqual(c.exception.limit, "depth")
+
+        data = ":User"
+        for _ in range(sys.getrecursionlimit() + 100):
+            data = {"query": data}
+        with self.assertRaises(BudgetExceeded):
+            target(data)
+
+    def test_statement_timeout(self):
+        target = self._makeOne(statement_timeout=0.5)
+        result = target({"query": ":User"})
+        self.assertEqual(result.perform()._execution_options["statement_timeout"], 0.5)
+        self.assertEqual(list(result), [])
+
+    def test_statement_timeout__interrupted(self):
+        infinite = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c"
+        with self.engine.connect() as conn:
+            with self.assertRaises(sa.exc.OperationalError):
+                conn.execution_options(statement_timeout=0.05).execute(infinite)
+            self.assertEqual(conn.execute("SELECT 1").scalar(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
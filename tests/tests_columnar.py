@@ -0,0 +1,72 @@
+# -*- coding:utf-8 -*-
+from array import array
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.declarative import declarative_base
+import unittest
+
+class AsColumnsTests(unittest.TestCase):
+    def setUp(self):
+        from block.sqla.lispy import create_parser
+
+        engine = sa.create_engine("sqlite://")
+        Base = declarative_base()
+        class Group(Base):
+            __tablename__ = "groups"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            group_id = sa.Column(sa.Integer(), sa.ForeignKey("groups.id"))
+            group = orm.relationship(Group, uselist=False, backref=("users"))
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+            score = sa.Column(sa.Float())
+
+        Base.metadata.create_all(engine)
+        self.Session = orm.sessionmaker(bind=engine)()
+        self.parser = create_parser(Base, self.Session.query)
+
+        group1 = Group(name="Group1")
+        group2 = Group(name="Group2")
+        self.Session.add_all([User(name="foo", group=group1, score=0.5),
+                              User(name="boo", group=group1, score=1.5),
+                              User(name="bar", group=group2)])
+        self.Session.commit()
+
+    def _callFUT(self, *args, **kwargs):
+        from block.sqla.lispy.columnar import as_columns
+        return as_columns(*args, **kwargs)
+
+    def test_it(self):
+        from block.sqla.lispy.columnar import DictionaryColumn
+        query = self.parser({"query": [":User.id", ":Group.name"],
+                             "filter": ["=", ":User.group_id", ":Group.id"],
+                             "order_by": ":User.id"})
+        result = self._callFUT(query, batch_size=2)
+        self.assertEqual(list(result.keys()), ["id", "name"])
+        self.assertEqual(result["id"], array("q", [1, 2, 3]))
+        self.assertIsInstance(result["name"], DictionaryColumn)
+        self.assertEqual(list(result["name"]), ["Group1", "Group1", "Group2"])
+        self.assertEqual(result["name"].values, ["Group1", "Group2"])
+
+    def test_null__fallbacks_to_list(self):
+        query = self.parser({"query": ":User.score", "order_by": ":User.id"})
+        result = self._callFUT(query, batch_size=1)
+        self.assertEqual(result["score"], [0.5, 1.5, None])
+
+    def test_high_cardinality__fallbacks_to_list(self):
+        from block.sqla.lispy.columnar import ColumnBuilder
+        query = self.parser({"query": ":User.name", "order_by": ":User.id"})
+        result = self._callFUT(query, batch_size=2, builder=ColumnBuilder(max_dictionary_size=2))
+        self.assertEqual(result["name"], ["foo", "boo", "bar"])
+
+    def test_query_proxy(self):
+        query = self.parser({"query": ":User", "order_by": ":User.id", "limit": 2})
+        result = query.as_columns()
+        self.assertEqual(list(result.keys()), ["id", "group_id", "name", "score"])
+        self.assertEqual(list(result["name"]), ["foo", "boo"])
+
+if __name__ == '__main__':
+    unittest.main()
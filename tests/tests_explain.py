@@ -0,0 +1,131 @@
+# -*- coding:utf-8 -*-
+import json
+import logging
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.declarative import declarative_base
+import unittest
+
+class ExplainerTests(unittest.TestCase):
+    def setUp(self):
+        from block.sqla.lispy import create_parser
+
+        engine = sa.create_engine("sqlite://")
+        Base = declarative_base()
+        class Group(Base):
+            __tablename__ = "groups"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            group_id = sa.Column(sa.Integer(), sa.ForeignKey("groups.id"))
+            group = orm.relationship(Group, uselist=False, backref=("users"))
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        Base.metadata.create_all(engine)
+        self.Base = Base
+        self.User = User
+        self.Session = orm.sessionmaker(bind=engine)()
+        self.parser = create_parser(Base, lambda *args: orm.Query(args))
+
+        group = Group(name="Group1")
+        self.Session.add_all([User(name="foo", group=group), User(name="bar", group=group)])
+        self.Session.commit()
+
+    def _makeOne(self, *args, **kwargs):
+        from block.sqla.lispy.explain import Explainer
+        return Explainer(self.parser, *args, **kwargs)
+
+    def _makeLog(self, threshold):
+        from block.sqla.lispy.explain import SlowQueryLog
+        records = []
+        class Handler(logging.Handler):
+            def emit(self, record):
+                records.append(record.getMessage())
+        log = logging.getLogger("tests_explain")
+        log.addHandler(Handler())
+        log.propagate = False
+        self.addCleanup(log.handlers.clear)
+        return SlowQueryLog(threshold, logger=log), records
+
+    def test_rows(self):
+        target = self._makeOne()
+        result = target({"query": ":User", "filter": ["=", ":User.name", "foo"]}, session=self.Session)
+        self.assertEqual([u.name for u in result], ["foo"])
+
+    def test_explain(self):
+        target = self._makeOne()
+        data = {"query": ":User", "filter": ["in", ":User.id", ["quote", 1, 2]], "limit": 10, "explain": True}
+        result = target(data, session=self.Session)
+        self.assertIn("FROM users", result["sql"])
+        self.assertIn([1, 2], result["params"].values())
+        self.assertEqual(result["rows"], 2)
+        self.assertTrue(result["plan"])
+        self.assertIn("USING INTEGER PRIMARY KEY", " ".join(str(e) for row in result["plan"] for e in row))
+        self.assertEqual(sorted(result["timings"].keys()), ["execute", "parse"])
+
+    def test_explain__postgresql(self):
+        from sqlalchemy.dialects import postgresql
+        from block.sqla.lispy.explain import Explain
+        statement = Explain(sa.select([self.User.id]).where(self.User.id == 1))
+        self.assertEqual(str(statement.compile(dialect=postgresql.dialect())),
+                         "EXPLAIN SELECT users.id \nFROM users \nWHERE users.id = %(id_1)s")
+
+    def test_slow_query_log(self):
+        slow_log, records = self._makeLog(0)
+        target = self._makeOne(slow_log=slow_log)
+        data = {"@cascade": [{"query": ":User"},
+                             {"filter": ["like", ":User.name", "f%"], "order_by": ["desc", ":User.id"]},
+                             {"filter": ["!=", ":User.id", 0], "limit": 10}]}
+        target(data, session=self.Session)
+        self.assertEqual(len(records), 1)
+        entry = json.loads(records[0])
+        self.assertEqual(entry["query"], {"query": [":User"],
+                                          "filter": ["and", ["like", ":User.name", "f%"], ["!=", ":User.id", 0]],
+                                          "order_by": ["desc", ":User.id"],
+                                          "limit": 10})
+        # replayable
+        replayed = self.parser(entry["query"]).with_session(self.Session)
+        self.assertEqual([u.name for u in replayed], ["foo"])
+
+    def test_slow_query_log__join(self):
+        slow_log, records = self._makeLog(0)
+        target = self._makeOne(slow_log=slow_log)
+        data = {"query": ":User", "filter": ["=", ":User.group.name", "Group1"]}
+        target(data, session=self.Session)
+        self.assertEqual(json.loads(records[0])["query"], data)
+
+    def test_slow_query_log__in(self):
+        from block.sqla.lispy import create_parser, InOperator, default_args_method_table
+        slow_log, records = self._makeLog(0)
+        args_method_table = dict(default_args_method_table)
+        args_method_table["in"] = InOperator(chunk_size=1)
+        parser = create_parser(self.Base, lambda *args: orm.Query(args), args_method_table=args_method_table)
+        for parser in [self.parser, parser]:
+            target = self._makeOne(slow_log=slow_log)
+            target.parser = parser
+            data = {"query": ":User.name", "filter": ["in", ":User.id", ["quote", 1, 2, 3]]}
+            target(data, session=self.Session)
+            entry = json.loads(records[-1])
+            self.assertNotEqual(entry["query"], data) # reversed
+            replayed = parser(entry["query"]).with_session(self.Session)
+            self.assertEqual(sorted(name for name, in replayed), ["bar", "foo"])
+
+    def test_slow_query_log__options(self):
+        slow_log, records = self._makeLog(0)
+        target = self._makeOne(slow_log=slow_log)
+        for data in [{"query": ":User", "fields": [":User.name"]},
+                     {"query": ":User", "load": {"group": "joined"}}]:
+            target(data, session=self.Session)
+            self.assertEqual(json.loads(records[-1])["query"], data)
+
+    def test_slow_query_log__fast(self):
+        slow_log, records = self._makeLog(60)
+        target = self._makeOne(slow_log=slow_log)
+        target({"query": ":User"}, session=self.Session)
+        self.assertEqual(records, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,7 +30,7 @@ class IntegrationTests(unittest.TestCase):
         self.Base.metadata.create_all()
 
     def setupFixture(self):
-        s = self.Session()
+        s = self.Session
         group1 = self.Group(name="Group1")
         group2 = self.Group(name="Group2")
         s.add(group1)
@@ -82,6 +82,124 @@ class IntegrationTests(unittest.TestCase):
         self.assertEqual(str(result), str(expected))
         self.assertEqual(list(result), list(expected))
 
+    def test_aggregation(self):
+        self.setupFixture()
+        target = self._makeOne(self.Base, self.Session.query)
+        data = {"query": [":Group.name", ["label", ["fn", "count", ":User.id"], "n"]],
+                "filter": ["=", ":User.group_id", ":Group.id"],
+                "group_by": ":Group.name",
+                "order_by": ["desc", "n"]}
+        result = target(data)
+        self.assertEqual(list(result), [("Group1", 2), ("Group2", 1)])
+
+    def test_relationship_path(self):
+        self.setupFixture()
+        target = self._makeOne(self.Base, self.Session.query)
+        data = {"query": {"query": ":User",
+                          "filter": ["like", ":User.group.name", "Group%"]},
+                "filter": ["!=", ":User.group.name", "Group2"],
+                "order_by": ["desc", ":User.group.id"]}
+        result = target(data)
+
+        group = orm.aliased(self.Group)
+        q = self.Session.query(self.User).outerjoin(group, self.User.group)
+        q = q.filter(group.name.like("Group%")).filter(group.name != "Group2")
+        expected = q.order_by(sa.desc(group.id))
+
+        self.assertEqual(str(result), str(expected))
+        self.assertEqual(sorted(u.name for u in result), ["boo", "foo"])
+
+    def test_relationship_path__or(self):
+        self.setupFixture()
+        self.Session.add(self.User(name="nogroup"))
+        self.Session.commit()
+        target = self._makeOne(self.Base, self.Session.query)
+        data = {"query": ":User",
+                "filter": ["or", ["=", ":User.name", "nogroup"], ["=", ":User.group.name", "Group1"]]}
+        self.assertEqual(sorted(u.name for u in target(data)), ["boo", "foo", "nogroup"])
+
+    def test_relationship_path__order_by(self):
+        self.setupFixture()
+        self.Session.add(self.User(name="nogroup"))
+        self.Session.commit()
+        target = self._makeOne(self.Base, self.Session.query)
+        data = {"query": ":User.name", "order_by": ["desc", ":User.group.name"]}
+        self.assertEqual(sorted(name for name, in target(data)), ["bar", "boo", "foo", "nogroup"])
+
+    def test_relationship_path__not_joined_in_target(self):
+        from block.sqla.lispy import InvalidElement
+        target = self._makeOne(self.Base, self.Session.query)
+        with self.assertRaises(InvalidElement):
+            target({"query": [":User.id", ":User.group.name"]})
+
+    def test_any(self):
+        self.setupFixture()
+        target = self._makeOne(self.Base, self.Session.query)
+        data = {"query": ":Group",
+                "filter": ["any", ":Group.users", ["in", ":User.name", ["quote", "foo", "boo"]]]}
+        result = target(data)
+        self.assertEqual([g.name for g in result], ["Group1"])
+
+    def test_has(self):
+        self.setupFixture()
+        target = self._makeOne(self.Base, self.Session.query)
+        data = {"query": ":User.name",
+                "filter": ["has", ":User.group", ["=", ":Group.name", "Group2"]]}
+        result = target(data)
+        self.assertEqual(list(result), [("bar",)])
+
+    def test_in__same_sql_for_any_size(self):
+        self.setupFixture()
+        target = self._makeOne(self.Base, self.Session.query)
+        result1 = target({"query": ":User.name", "filter": ["in", ":User.id", ["quote", 1]]})
+        result2 = target({"query": ":User.name", "filter": ["in", ":User.id", ["quote", 1, 2, 100]]})
+        self.assertEqual(str(result1), str(result2))
+        self.assertEqual(list(result1), [("foo",)])
+        self.assertEqual(list(result2), [("foo",), ("boo",)])
+
+    def test_in__chunked(self):
+        from block.sqla.lispy import default_args_method_table, InOperator
+        self.setupFixture()
+        args_method_table = default_args_method_table.copy()
+        args_method_table["in"] = InOperator(chunk_size=2)
+        target = self._makeOne(self.Base, self.Session.query, args_method_table=args_method_table)
+        result = target({"query": ":User.name", "filter": ["not", ["in", ":User.id", ["quote", 1, 3, 4, 5, 6]]]})
+        self.assertEqual(str(result).count(" IN "), 3)
+        self.assertEqual(list(result), [("boo",)])
+
+    def test_in__temporary_table(self):
+        from block.sqla.lispy import default_args_method_table, TemporaryTableInOperator
+        self.setupFixture()
+        args_method_table = default_args_method_table.copy()
+        args_method_table["in"] = TemporaryTableInOperator(self.Session.connection, threshold=100)
+        target = self._makeOne(self.Base, self.Session.query, args_method_table=args_method_table)
+        values = list(range(2, 5000))
+        result = target({"query": ":User.name", "filter": ["in", ":User.id", ["quote"] + values]})
+        self.assertIn("lispy_in_integer", str(result))
+        self.assertEqual(sorted(list(result)), [("bar",), ("boo",)])
+
+    def test_in__temporary_table__reused(self):
+        from block.sqla.lispy import default_args_method_table, TemporaryTableInOperator, QueryCache
+        self.setupFixture()
+        args_method_table = default_args_method_table.copy()
+        args_method_table["in"] = TemporaryTableInOperator(self.Session.connection, threshold=100)
+        target = self._makeOne(self.Base, self.Session.query, args_method_table=args_method_table, cache=QueryCache())
+        connection = self.Session.connection()
+        data = {"query": ":User.name",
+                "filter": ["and",
+                           ["in", ":User.id", ["quote"] + list(range(2, 1000))],
+                           ["in", ":User.name", ["quote"] + ["boo", "bar"] + ["x{}".format(i) for i in range(200)]]]}
+        for _ in range(3):
+            self.assertEqual(sorted(target(data)), [("bar",), ("boo",)])
+        tables = connection.execute("SELECT name FROM sqlite_temp_master WHERE type = 'table'").fetchall()
+        self.assertEqual(sorted(name for name, in tables), ["lispy_in_integer", "lispy_in_string"])
+        self.assertEqual(target.cache.misses + target.cache.hits, 0) # not cached
+
+        self.Session.close() # the connection is returned to the pool
+        tables = self.Session.connection().execute("SELECT name FROM sqlite_temp_master WHERE type = 'table'").fetchall()
+        self.assertEqual(tables, [])
+        self.assertEqual(sorted(target(data)), [("bar",), ("boo",)])
+
 if __name__ == '__main__':
     unittest.main()
 
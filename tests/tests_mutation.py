@@ -0,0 +1,206 @@
+# -*- coding:utf-8 -*-
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.declarative import declarative_base
+import unittest
+
+class MutatorTests(unittest.TestCase):
+    def setUp(self):
+        from block.sqla.lispy import create_parser
+
+        engine = sa.create_engine("sqlite://")
+        Base = declarative_base()
+        class Group(Base):
+            __tablename__ = "groups"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            group_id = sa.Column(sa.Integer(), sa.ForeignKey("groups.id"))
+            group = orm.relationship(Group, uselist=False, backref=("users"))
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+            active = sa.Column(sa.Boolean(), nullable=False, default=True)
+
+        Base.metadata.create_all(engine)
+        self.User = User
+        self.Session = orm.sessionmaker(bind=engine)()
+        self.parser = create_parser(Base, self.Session.query)
+
+        group1 = Group(name="Group1")
+        group2 = Group(name="Group2")
+        self.Session.add_all([User(name="foo", group=group1),
+                              User(name="boo", group=group1),
+                              User(name="bar", group=group2)])
+        self.Session.commit()
+
+    def _makeOne(self, *args, **kwargs):
+        from block.sqla.lispy.mutation import Mutator
+        return Mutator(self.parser, *args, **kwargs)
+
+    def _active_names(self):
+        q = self.Session.query(self.User.name).filter(self.User.active == True).order_by(self.User.id)
+        return [name for name, in q]
+
+    def test_update(self):
+        target = self._makeOne(synchronize_session="fetch")
+        foo = self.Session.query(self.User).filter_by(name="foo").one()
+        data = {"update": {"query": ":User",
+                           "set": {":User.active": False},
+                           "filter": ["like", ":User.name", "%oo"]}}
+        result = target(data)
+        self.assertEqual(result, 2)
+        self.assertFalse(foo.active) # synchronized
+        self.assertEqual(self._active_names(), ["bar"])
+
+    def test_update__evaluate(self):
+        target = self._makeOne()
+        foo = self.Session.query(self.User).filter_by(name="foo").one()
+        data = {"update": {"query": ":User", "set": {"active": False}, "filter": ["=", ":User.id", foo.id]}}
+        self.assertEqual(target(data), 1)
+        self.assertFalse(foo.active)
+
+    def test_update__with_expression(self):
+        target = self._makeOne(synchronize_session=False)
+        data = {"update": {"query": ":User",
+                           "set": {"name": ["fn", "upper", ":User.name"]},
+                           "filter": ["=", ":User.name", "bar"]}}
+        self.assertEqual(target(data), 1)
+        self.assertEqual(self._active_names(), ["foo", "boo", "BAR"])
+
+    def test_update__other_entity(self):
+        from block.sqla.lispy import InvalidElement
+        target = self._makeOne()
+        for k in [":Group.name", ":User.group", ":User.group.name", "password"]:
+            data = {"update": {"query": ":User", "set": {k: "zz"}, "filter": ["=", ":User.id", 1]}}
+            with self.assertRaises(InvalidElement):
+                target(data)
+        self.assertEqual(self._active_names(), ["foo", "boo", "bar"])
+
+    def test_update__in(self):
+        target = self._makeOne()
+        foo = self.Session.query(self.User).filter_by(name="foo").one()
+        data = {"update": {"query": ":User", "set": {"active": False}, "filter": ["in", ":User.id", ["quote", foo.id, 100]]}}
+        self.assertEqual(target(data), 1)
+        self.assertFalse(foo.active) # synchronized by fetch
+        self.assertEqual(self._active_names(), ["boo", "bar"])
+
+    def test_delete__in(self):
+        target = self._makeOne()
+        data = {"delete": {"query": ":User", "filter": ["in", ":User.name", ["quote", "foo", "bar", "xxx"]]}}
+        self.assertEqual(target(data), 2)
+        self.assertEqual(self._active_names(), ["boo"])
+
+    def test_update__without_query(self):
+        target = self._makeOne()
+        data = {"update": {"set": {":User.active": False}, "filter": ["like", ":User.name", "%oo"]}}
+        self.assertEqual(target(data), 2)
+        self.assertEqual(self._active_names(), ["bar"])
+
+    def test_delete__without_query(self):
+        target = self._makeOne()
+        self.assertEqual(target({"delete": {"filter": ["=", ":User.name", "foo"]}}), 1)
+        self.assertEqual(self._active_names(), ["boo", "bar"])
+
+    def test_delete__without_query__ambiguous(self):
+        from block.sqla.lispy import InvalidElement
+        target = self._makeOne()
+        with self.assertRaises(InvalidElement):
+            target({"delete": {"filter": ["has", ":User.group", ["=", ":Group.name", "Group1"]]}})
+        with self.assertRaises(InvalidElement):
+            target({"delete": {"filter": ["=", 1, 1]}})
+        self.assertEqual(self._active_names(), ["foo", "boo", "bar"])
+
+    def test_delete(self):
+        target = self._makeOne(synchronize_session="fetch")
+        data = {"delete": {"@cascade": [{"query": ":User"},
+                                        {"filter": ["=", ":User.group_id", 1]},
+                                        {"filter": ["=", ":User.name", "boo"]}]}}
+        self.assertEqual(target(data), 1)
+        self.assertEqual(self._active_names(), ["foo", "bar"])
+
+    def test_empty_filter(self):
+        from block.sqla.lispy.mutation import UnsafeMutation
+        target = self._makeOne()
+        with self.assertRaises(UnsafeMutation):
+            target({"delete": {"query": ":User"}})
+        with self.assertRaises(UnsafeMutation):
+            target({"update": {"query": ":User", "set": {":User.active": False}}})
+        self.assertEqual(self._active_names(), ["foo", "boo", "bar"])
+
+    def test_constant_filter(self):
+        from block.sqla.lispy.mutation import UnsafeMutation
+        target = self._makeOne()
+        with self.assertRaises(UnsafeMutation):
+            target({"delete": {"query": ":User", "filter": ["=", 1, 1]}})
+        self.assertEqual(self._active_names(), ["foo", "boo", "bar"])
+
+    def test_relationship_path(self):
+        from block.sqla.lispy import InvalidElement
+        target = self._makeOne()
+        with self.assertRaises(InvalidElement):
+            target({"delete": {"query": ":User", "filter": ["=", ":User.group.name", "Group1"]}})
+        data = {"delete": {"query": ":User", "filter": ["has", ":User.group", ["=", ":Group.name", "Group1"]]}}
+        self.assertEqual(self._makeOne(synchronize_session="fetch")(data), 2)
+        self.assertEqual(self._active_names(), ["bar"])
+
+    def test_limit(self):
+        from block.sqla.lispy import InvalidElement
+        target = self._makeOne()
+        with self.assertRaises(InvalidElement):
+            target({"delete": {"query": ":User", "filter": ["=", ":User.group_id", 1], "limit": 1}})
+        with self.assertRaises(InvalidElement):
+            target({"update": {"query": ":User", "set": {"active": False}, "filter": ["=", ":User.group_id", 1], "offset": 1}})
+
+    def test_empty_filter__allowed(self):
+        target = self._makeOne(allow_empty_filter=True)
+        self.assertEqual(target({"delete": {"query": ":User"}}), 3)
+
+    def test_insert(self):
+        target = self._makeOne(batch_size=2)
+        rows = ({"name": "user{}".format(i), "group_id": 2} for i in range(5))
+        result = target({"insert": ":User", "rows": rows})
+        self.assertEqual(result, 5)
+        names = self.Session.query(self.User.name).filter(self.User.group_id == 2).order_by(self.User.id)
+        self.assertEqual([name for name, in names], ["bar", "user0", "user1", "user2", "user3", "user4"])
+
+    def test_insert__different_columns(self):
+        target = self._makeOne()
+        rows = [{"name": "x"}, {"name": "y", "active": False}, {"name": "z"}]
+        self.assertEqual(target({"insert": ":User", "rows": rows}), 3)
+        self.assertEqual(self._active_names(), ["foo", "boo", "bar", "x", "z"])
+
+    def test_insert__invalid_column(self):
+        from block.sqla.lispy import InvalidElement
+        target = self._makeOne()
+        with self.assertRaises(InvalidElement):
+            target({"insert": ":User", "rows": [{"name": "x", "password": "xxx"}]})
+
+    def test_upsert__nothing(self):
+        target = self._makeOne()
+        data = {"insert": ":User",
+                "rows": [{"name": "foo", "active": False}, {"name": "x"}],
+                "on_conflict": {"index": ["name"]}}
+        self.assertEqual(target(data), 1)
+        self.assertEqual(self._active_names(), ["foo", "boo", "bar", "x"])
+
+    def test_upsert__update(self):
+        target = self._makeOne()
+        data = {"insert": ":User",
+                "rows": [{"name": "foo", "active": False, "group_id": 2}, {"name": "x", "group_id": 2}],
+                "on_conflict": {"index": ["name"], "set": ["active", "group_id"]}}
+        self.assertEqual(target(data), 2)
+        self.assertEqual(self._active_names(), ["boo", "bar", "x"])
+        foo = self.Session.query(self.User).filter_by(name="foo").one()
+        self.assertEqual((foo.id, foo.group_id), (1, 2))
+
+    def test_upsert__postgresql(self):
+        from sqlalchemy.dialects import postgresql
+        from block.sqla.lispy.mutation import postgresql_upsert
+        statement = postgresql_upsert(self.User.__table__, ["name"], set_=["active"])
+        self.assertIn("ON CONFLICT (name) DO UPDATE SET active = excluded.active",
+                      str(statement.compile(dialect=postgresql.dialect())))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding:utf-8 -*-
+import warnings
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.declarative import declarative_base
+import unittest
+
+class LoadTests(unittest.TestCase):
+    def setUp(self):
+        from block.sqla.lispy import create_parser
+
+        engine = sa.create_engine("sqlite://")
+        Base = declarative_base()
+        class Group(Base):
+            __tablename__ = "groups"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            group_id = sa.Column(sa.Integer(), sa.ForeignKey("groups.id"))
+            group = orm.relationship(Group, uselist=False, backref=("users"))
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        Base.metadata.create_all(engine)
+        self.Base = Base
+        self.User = User
+        self.Group = Group
+        self.Session = orm.sessionmaker(bind=engine)()
+        self.parser = create_parser(Base, self.Session.query)
+
+        session = orm.sessionmaker(bind=engine)()
+        group1 = Group(name="Group1")
+        group2 = Group(name="Group2")
+        session.add_all([User(name="foo", group=group1),
+                         User(name="boo", group=group1),
+                         User(name="bar", group=group2)])
+        session.commit()
+
+    def _makeOne(self, *args, **kwargs):
+        from block.sqla.lispy.nplusone import LazyLoadCounter
+        return LazyLoadCounter(self.Base, *args, **kwargs)
+
+    def test_parse_load(self):
+        data = {"query": ":User", "load": {"group": "joined", "group.users": "selectin"}}
+        result = self.parser(data)
+        q = self.Session.query(self.User)
+        expected = q.options(orm.joinedload(self.User.group), orm.defaultload(self.User.group).selectinload(self.Group.users))
+        self.assertEqual(str(result), str(expected))
+
+    def test_parse_load__not_found(self):
+        from block.sqla.lispy import InvalidElement
+        with self.assertRaises(InvalidElement):
+            self.parser({"query": ":User", "load": {"name": "joined"}})
+        with self.assertRaises(InvalidElement):
+            self.parser({"query": ":User", "load": {"group": "eager"}})
+
+    def test_lazy_loads__warned(self):
+        with warnings.catch_warnings(record=True) as ws:
+            warnings.simplefilter("always")
+            with self._makeOne(threshold=1) as counter:
+                names = [u.group.name for u in self.parser({"query": ":User", "order_by": ":User.id"})]
+        self.assertEqual(names, ["Group1", "Group1", "Group2"])
+        self.assertEqual(counter.count, 2)
+        self.assertEqual(len(ws), 1)
+
+    def test_lazy_loads__raised(self):
+        from block.sqla.lispy.nplusone import NPlusOneError
+        with self.assertRaises(NPlusOneError):
+            with self._makeOne(raise_error=True):
+                [g.users for g in self.parser({"query": ":Group"})]
+
+    def test_planned(self):
+        data = {"query": ":Group", "load": {"users": "selectin", "users.group": "joined"}}
+        with self._makeOne(raise_error=True) as counter:
+            names = sorted(u.group.name for g in self.parser(data) for u in g.users)
+        self.assertEqual(names, ["Group1", "Group1", "Group2"])
+        self.assertEqual(counter.count, 0)
+
+    def test_raise(self):
+        data = {"query": ":User", "load": {"*": "raise"}}
+        users = list(self.parser(data))
+        with self.assertRaises(sa.exc.InvalidRequestError):
+            users[0].group
+
+if __name__ == '__main__':
+    unittest.main()
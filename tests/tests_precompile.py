@@ -0,0 +1,71 @@
+# -*- coding:utf-8 -*-
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.declarative import declarative_base
+import unittest
+
+Base = declarative_base()
+
+class Group(Base):
+    __tablename__ = "groups"
+    id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+    name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+class User(Base):
+    __tablename__ = "users"
+    id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+    group_id = sa.Column(sa.Integer(), sa.ForeignKey("groups.id"))
+    name = sa.Column(sa.String(255), unique=True, nullable=False)
+    active = sa.Column(sa.Boolean(), nullable=False, default=True)
+
+def create_test_parser():
+    from block.sqla.lispy import create_parser
+    return create_parser(Base, lambda *args: orm.Query(args))
+
+class PrecompileTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = sa.create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.connection = self.engine.connect()
+        self.addCleanup(self.connection.close)
+        self.connection.execute(Group.__table__.insert(), [{"name": "Group1"}, {"name": "Group2"}])
+        self.connection.execute(User.__table__.insert(), [
+            {"name": "foo", "group_id": 1, "active": True},
+            {"name": "boo", "group_id": 1, "active": False},
+            {"name": "bar", "group_id": 2, "active": True},
+        ])
+        self.documents = [
+            {"query": ":User.name", "filter": ["in", ":User.id", ["quote", 1, 3]], "order_by": ":User.id"},
+            {"query": ":User.name", "filter": ["=", ":User.active", False]},
+            {"query": ":Group.name", "order_by": ["desc", ":Group.id"], "limit": 1},
+        ]
+        self.expected = [[("foo",), ("bar",)], [("boo",)], [("Group2",)]]
+
+    def _execute(self, compiled):
+        from block.sqla.lispy.precompile import execute_compiled
+        return [[tuple(row) for row in execute_compiled(self.connection, c)] for c in compiled]
+
+    def test_compile_document(self):
+        from block.sqla.lispy.precompile import compile_document, create_dialect
+        parser = create_test_parser()
+        dialect = create_dialect("sqlite")
+        compiled = [compile_document(parser, dialect, data) for data in self.documents]
+        self.assertIn("users.id IN (?, ?)", compiled[0].sql)
+        self.assertEqual(compiled[0].params, (1, 3))
+        self.assertEqual(compiled[2].params, (1, 0))  # limit, offset
+        self.assertEqual(self._execute(compiled), self.expected)
+
+    def test_compile_document__postgresql(self):
+        from block.sqla.lispy.precompile import compile_document, create_dialect
+        compiled = compile_document(create_test_parser(), create_dialect("postgresql"), self.documents[0])
+        self.assertIn("users.id IN (%(id_1)s, %(id_2)s)", compiled.sql)
+        self.assertEqual(compiled.params, {"id_1": 1, "id_2": 3})
+
+    def test_precompiler(self):
+        from block.sqla.lispy.precompile import Precompiler
+        with Precompiler(create_test_parser, "sqlite", processes=2, chunksize=2) as target:
+            compiled = list(target.compile_all(self.documents * 3))
+        self.assertEqual(self._execute(compiled), self.expected * 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# -*- coding:utf-8 -*-
+import json
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.declarative import declarative_base
+import unittest
+
+class ProjectionTests(unittest.TestCase):
+    def setUp(self):
+        engine = sa.create_engine("sqlite://")
+        Base = declarative_base()
+        class Group(Base):
+            __tablename__ = "groups"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+            description = sa.Column(sa.Text())
+
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            group_id = sa.Column(sa.Integer(), sa.ForeignKey("groups.id"))
+            group = orm.relationship(Group, uselist=False, backref=("users"))
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+            bio = sa.Column(sa.Text())
+            avatar = sa.Column(sa.LargeBinary())
+
+        Base.metadata.create_all(engine)
+        self.Base = Base
+        self.User = User
+        self.Group = Group
+        self.Session = orm.sessionmaker(bind=engine)()
+
+        session = orm.sessionmaker(bind=engine)()
+        group = Group(name="Group1", description="...")
+        session.add_all([User(name="foo", group=group, bio="foo's bio", avatar=b"xxx"),
+                         User(name="bar", group=group, bio="bar's bio")])
+        session.commit()
+
+    def _makeParser(self, **kwargs):
+        from block.sqla.lispy import create_parser
+        return create_parser(self.Base, self.Session.query, **kwargs)
+
+    def test_fields(self):
+        parser = self._makeParser()
+        result = parser({"query": ":User", "fields": [":User.name"], "order_by": ":User.id"})
+        statement = str(result)
+        self.assertIn("users.id", statement)
+        self.assertIn("users.name", statement)
+        self.assertNotIn("users.bio", statement)
+        self.assertNotIn("users.group_id", statement)
+        users = list(result)
+        self.assertEqual([u.name for u in users], ["foo", "bar"])
+        self.assertNotIn("bio", users[0].__dict__)
+
+    def test_fields__nested(self):
+        parser = self._makeParser()
+        data = {"query": ":User", "fields": [":User.name", ":User.group.name"], "load": {"group": "joined"}, "order_by": ":User.id"}
+        result = parser(data)
+        statement = str(result)
+        self.assertIn("users.group_id", statement)  # needed by the relationship
+        self.assertIn("groups_1.name", statement)
+        self.assertNotIn("description", statement)
+        self.assertEqual([(u.name, u.group.name) for u in result], [("foo", "Group1"), ("bar", "Group1")])
+
+    def test_fields__not_column(self):
+        from block.sqla.lispy import InvalidElement
+        parser = self._makeParser()
+        with self.assertRaises(InvalidElement):
+            parser({"query": ":User", "fields": [":User.group"]})
+
+    def test_projection(self):
+        from block.sqla.lispy import DeferHeavyColumns
+        parser = self._makeParser(projection=DeferHeavyColumns())
+        result = parser({"query": ":User", "order_by": ":User.id"})
+        statement = str(result)
+        self.assertIn("users.name", statement)
+        self.assertNotIn("users.bio", statement)
+        self.assertNotIn("users.avatar", statement)
+        self.assertEqual(list(result)[0].bio, "foo's bio")  # loaded on access
+
+    def test_projection__requested(self):
+        from block.sqla.lispy import DeferHeavyColumns
+        parser = self._makeParser(projection=DeferHeavyColumns())
+        statement = str(parser({"query": ":User", "fields": [":User.name", ":User.bio"]}))
+        self.assertIn("users.bio", statement)
+        self.assertNotIn("users.avatar", statement)
+
+    def test_projection__per_model(self):
+        from block.sqla.lispy import DeferHeavyColumns
+        parser = self._makeParser(projection=DeferHeavyColumns(models={self.User: ["avatar"]}))
+        statement = str(parser({"query": ":User"}))
+        self.assertIn("users.bio", statement)
+        self.assertNotIn("users.avatar", statement)
+
+    def test_dump__fields(self):
+        from block.sqla.lispy.serialize import dump
+        parser = self._makeParser()
+        result = dump(parser({"query": ":User", "fields": [":User.name"], "order_by": ":User.id"}))
+        self.assertEqual(json.loads("".join(result)), [{"id": 1, "name": "foo"}, {"id": 2, "name": "bar"}])
+
+    def test_dump__projection(self):
+        from block.sqla.lispy import DeferHeavyColumns
+        from block.sqla.lispy.serialize import dump
+        parser = self._makeParser(projection=DeferHeavyColumns())
+        result = dump(parser({"query": ":User", "order_by": ":User.id"}), format="columnar")
+        self.assertEqual(list(result.keys()), ["id", "group_id", "name"])
+
+    def test_dump__projection__aliased(self):
+        from block.sqla.lispy.serialize import projection
+        User = orm.aliased(self.User)
+        query = self.Session.query(User).options(orm.Load(User).load_only("name"))
+        self.assertEqual([name for name, _ in projection(query)], ["id", "name"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -60,6 +60,74 @@ class ReverseHandlerTests(unittest.TestCase):
         self.assertEqual(result, ['and', ['like', ':User.name', '%foo%'], ['=', ':User.id', 1]])
 
 
+    def test_function(self):
+        result = self._callFUT(sa.func.count(self.User.id))
+        self.assertEqual(result, ['fn', 'count', ':User.id'])
+        result = self._callFUT(sa.func.count(self.User.id).label("n"))
+        self.assertEqual(result, ['label', ['fn', 'count', ':User.id'], 'n'])
+
+
+class CachingReverseHandlerTests(unittest.TestCase):
+    def setUp(self):
+        Base = declarative_base()
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        self.User = User
+
+    def _makeOne(self):
+        from sqlalchemy.util import LRUCache
+        from block.sqla.lispy.reverse import create_reverse_handler
+        return create_reverse_handler(cache=LRUCache(100))
+
+    def _callFUT(self, handler, data):
+        return handler.handle(IdentityContext(), data)
+
+    def test_it(self):
+        target = self._makeOne()
+        User = self.User
+        expr = lambda: sa.and_(User.id == 1, User.name.like("%foo%"))
+        result = self._callFUT(target, expr())
+        self.assertEqual(result, ["and", ["=", ":User.id", 1], ["like", ":User.name", "%foo%"]])
+        misses = target.misses
+        self.assertIs(self._callFUT(target, expr()), result)
+        self.assertEqual((target.hits, target.misses), (1, misses))
+
+    def test_different_values(self):
+        target = self._makeOne()
+        User = self.User
+        self.assertEqual(self._callFUT(target, User.id == 1), ["=", ":User.id", 1])
+        self.assertEqual(self._callFUT(target, User.id == 2), ["=", ":User.id", 2])
+        self.assertEqual(self._callFUT(target, User.name == "2"), ["=", ":User.name", "2"])
+        self.assertEqual(self._callFUT(target, User.id < 2), ["<", ":User.id", 2])
+
+    def test_value_types(self):
+        target = self._makeOne()
+        User = self.User
+        for v in [1, 1.0, True, "1"]:
+            result = self._callFUT(target, User.name == sa.literal(v))[2]
+            self.assertEqual((type(result), result), (type(v), v))
+        for v in [[1, 2], [1.0, 2], [True, 2]]:
+            result = self._callFUT(target, User.id.in_(sa.bindparam("in_values", v, expanding=True)))[2]
+            self.assertEqual(result[0], "quote")
+            self.assertEqual([type(e) for e in result[1:]], [type(e) for e in v])
+
+    def test_name_is_not_cached(self):
+        from block.sqla.lispy.reverse import expression_key, Name
+        from block.sqla.lispy import Uncacheable
+        with self.assertRaises(Uncacheable):
+            expression_key(sa.and_(self.User.id == 1, self.User.name == Name("name")))
+
+    def test_render(self):
+        from block.sqla.lispy.reverse import ReverseQuery, create_env, Name
+        env = create_env(reverse_handler=self._makeOne())
+        q = ReverseQuery(env)(self.User).filter(sa.and_(self.User.id == 1, self.User.name == Name("name")))
+        self.assertEqual(q.render(name="foo")["filter"], ["and", ["=", ":User.id", 1], ["=", ":User.name", "foo"]])
+        self.assertEqual(q.render(name="bar")["filter"], ["and", ["=", ":User.id", 1], ["=", ":User.name", "bar"]])
+        self.assertEqual(dict(q.collect()), {"name": ["filter.1.2"]})
+
 
 class ReverseQueryRenderingTests(unittest.TestCase):
     def setUp(self):
@@ -115,6 +183,15 @@ class ReverseQueryRenderingTests(unittest.TestCase):
                           'limit': 10,
                           'order_by': ['desc', ':User.id']})
 
+    def test_nested_data_is_shared(self):
+        target = self._makeOne(self.env)
+        base = target(self.Group).filter(self.Group.id==1)
+        q1 = base.filter(self.Group.name=="foo")
+        q2 = base.filter(self.Group.name=="bar")
+        self.assertIs(q1.data["query"], base.data)
+        self.assertIs(q2.data["query"], base.data)
+        self.assertEqual(base.render(), {'filter': ['=', ':Group.id', 1], 'query': [':Group']})
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,71 @@
+# -*- coding:utf-8 -*-
+import json
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.declarative import declarative_base
+import unittest
+
+class DumpTests(unittest.TestCase):
+    def setUp(self):
+        from block.sqla.lispy import create_parser
+
+        engine = sa.create_engine("sqlite://")
+        Base = declarative_base()
+        class Group(Base):
+            __tablename__ = "groups"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            group_id = sa.Column(sa.Integer(), sa.ForeignKey("groups.id"))
+            group = orm.relationship(Group, uselist=False, backref=("users"))
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        Base.metadata.create_all(engine)
+        self.Session = orm.sessionmaker(bind=engine)()
+        self.parser = create_parser(Base, self.Session.query)
+
+        group1 = Group(name="Group1")
+        group2 = Group(name="Group2")
+        self.Session.add_all([User(name="foo", group=group1),
+                              User(name="boo", group=group1),
+                              User(name="bar", group=group2)])
+        self.Session.commit()
+
+    def _callFUT(self, *args, **kwargs):
+        from block.sqla.lispy.serialize import dump
+        return dump(*args, **kwargs)
+
+    def test_json__entity(self):
+        query = self.parser({"query": ":User", "order_by": ":User.id", "limit": 2})
+        result = list(self._callFUT(query, batch_size=1))
+        self.assertEqual(result[0], "[")
+        self.assertEqual(json.loads("".join(result)),
+                         [{"id": 1, "group_id": 1, "name": "foo"},
+                          {"id": 2, "group_id": 1, "name": "boo"}])
+
+    def test_json__columns(self):
+        query = self.parser({"query": [":User.name", ":Group.name"],
+                             "filter": ["=", ":User.group_id", ":Group.id"],
+                             "order_by": ":User.id"})
+        result = "".join(self._callFUT(query))
+        self.assertEqual(json.loads(result),
+                         [{"name": "foo", "Group.name": "Group1"},
+                          {"name": "boo", "Group.name": "Group1"},
+                          {"name": "bar", "Group.name": "Group2"}])
+
+    def test_json__empty(self):
+        query = self.parser({"query": ":User", "filter": ["=", ":User.id", -1]})
+        self.assertEqual("".join(self._callFUT(query)), "[]")
+
+    def test_ndjson(self):
+        query = self.parser({"query": [":User.id", ":User.name"], "order_by": ":User.id"})
+        result = b"".join(self._callFUT(query, format="ndjson", batch_size=2, encoding="utf-8"))
+        lines = result.decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{"id": 1, "name": "foo"}, {"id": 2, "name": "boo"}, {"id": 3, "name": "bar"}])
+
+if __name__ == '__main__':
+    unittest.main()
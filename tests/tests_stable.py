@@ -0,0 +1,92 @@
+# -*- coding:utf-8 -*-
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects import postgresql
+import unittest
+
+class ShapeTests(unittest.TestCase):
+    def _callFUT(self, data):
+        from block.sqla.lispy.stable import shape_of
+        return shape_of(data)
+
+    def test_it(self):
+        data1 = {"query": ":User", "filter": ["in", ":User.id", ["quote", 1, 2]], "limit": 10}
+        data2 = {"query": ":User", "filter": ["in", ":User.id", ["quote", 3]], "limit": 20}
+        self.assertEqual(self._callFUT(data1), self._callFUT(data2))
+
+    def test_different_shape(self):
+        data1 = {"query": ":User", "filter": ["=", ":User.id", 1]}
+        data2 = {"query": ":User", "filter": ["=", ":User.name", "foo"]}
+        self.assertNotEqual(self._callFUT(data1), self._callFUT(data2))
+
+    def test_nested_list(self):
+        data1 = {"query": [["fn", "count", ":User.id"]], "filter": ["=", ":User.group_id", 1]}
+        data2 = {"query": [["fn", "count", ":User.id"]], "filter": ["=", ":User.group_id", 2]}
+        self.assertEqual(hash(self._callFUT(data1)), hash(self._callFUT(data2)))
+
+
+class SQLTextReportTests(unittest.TestCase):
+    def setUp(self):
+        Base = declarative_base()
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+            active = sa.Column(sa.Boolean(), nullable=False)
+
+        self.Base = Base
+        self.User = User
+        self.documents = [
+            {"query": ":User", "filter": ["=", ":User.active", flag], "limit": limit}
+            for flag in [True, False] for limit in [10, 20]
+        ] + [
+            {"query": ":User", "filter": ["in", ":User.id", ["quote"] + list(range(size))]}
+            for size in [1, 10, 100]
+        ] + [
+            {"query": ":User", "filter": ["like", ":User.name", name]}
+            for name in ["foo%", "bar%"]
+        ]
+
+    def _callFUT(self, parser):
+        from block.sqla.lispy.stable import sql_text_report
+        return sql_text_report(parser, self.documents, dialect=postgresql.dialect())
+
+    def _makeParser(self, **kwargs):
+        from block.sqla.lispy import create_parser
+        return create_parser(self.Base, lambda *args: orm.Query(args), **kwargs)
+
+    def test_default(self):
+        result = self._callFUT(self._makeParser())
+        self.assertEqual(result["documents"], 9)
+        self.assertEqual(result["shapes"], 3)
+        self.assertEqual(result["sql_texts"], 4)
+        self.assertEqual(len(result["unstable_shapes"]), 1)
+
+    def test_stable(self):
+        from block.sqla.lispy.stable import create_stable_args_method_table
+        result = self._callFUT(self._makeParser(args_method_table=create_stable_args_method_table()))
+        self.assertEqual(result["shapes"], 3)
+        self.assertEqual(result["sql_texts"], 3)
+        self.assertEqual(result["unstable_shapes"], [])
+
+    def test_stable__long_in_list(self):
+        from block.sqla.lispy import InOperator
+        from block.sqla.lispy.stable import create_stable_args_method_table
+        chunk_size = InOperator().chunk_size
+        self.documents = [{"query": ":User", "filter": ["in", ":User.id", ["quote"] + list(range(size))]}
+                          for size in [10, chunk_size, chunk_size + 1, chunk_size * 5]]
+        result = self._callFUT(self._makeParser(args_method_table=create_stable_args_method_table()))
+        self.assertEqual(result["shapes"], 1)
+        self.assertEqual(result["sql_texts"], 1)
+        self.assertEqual(result["unstable_shapes"], [])
+
+    def test_stable__literal_comparison(self):
+        from block.sqla.lispy.stable import create_stable_args_method_table
+        parser = self._makeParser(args_method_table=create_stable_args_method_table())
+        result = parser({"query": ":User", "filter": ["and", ["=", 1, 1], ["like", ":User.name", "foo%"]]})
+        statement = str(result.perform().statement.compile(dialect=postgresql.dialect()))
+        self.assertIn("%(literal_1)s = %(literal_2)s AND users.name LIKE %(literal_3)s", statement)
+
+if __name__ == '__main__':
+    unittest.main()
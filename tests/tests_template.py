@@ -0,0 +1,129 @@
+# -*- coding:utf-8 -*-
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.declarative import declarative_base
+import unittest
+
+class TemplateRegistryTests(unittest.TestCase):
+    def setUp(self):
+        from block.sqla.lispy import create_parser
+        from block.sqla.lispy.reverse import ReverseQuery, create_env
+
+        engine = sa.create_engine("sqlite://")
+        Base = declarative_base()
+        class Group(Base):
+            __tablename__ = "groups"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        class User(Base):
+            __tablename__ = "users"
+            id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+            group_id = sa.Column(sa.Integer(), sa.ForeignKey("groups.id"))
+            group = orm.relationship(Group, uselist=False, backref=("users"))
+            name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+        Base.metadata.create_all(engine)
+        self.Base = Base
+        self.User = User
+        self.Group = Group
+        self.Session = orm.sessionmaker(bind=engine)()
+        self.parser = create_parser(Base, self.Session.query)
+        self.query_factory = ReverseQuery(create_env())
+
+        group1 = Group(name="Group1")
+        group2 = Group(name="Group2")
+        self.Session.add_all([User(name="foo", group=group1),
+                              User(name="boo", group=group1),
+                              User(name="bar", group=group2)])
+        self.Session.commit()
+
+    def _makeOne(self, *args, **kwargs):
+        from block.sqla.lispy.template import TemplateRegistry
+        return TemplateRegistry(*args, **kwargs)
+
+    def _useOne(self, name):
+        from block.sqla.lispy.reverse import Name
+        return Name(name)
+
+    def _registerUsersByGroup(self, target):
+        q = self.query_factory(self.User)
+        q = q.filter(self.User.group_id==self._useOne("group_id")).order_by(self.User.id)
+        target.register("users_by_group", q.limit(self._useOne("limit")))
+
+    def test_it(self):
+        target = self._makeOne(self.parser)
+        self._registerUsersByGroup(target)
+        group1 = self.Session.query(self.Group).filter_by(name="Group1").one()
+
+        result = target({"template": "users_by_group", "params": {"group_id": group1.id, "limit": 10}})
+        self.assertEqual([u.name for u in result], ["foo", "boo"])
+
+        result = target({"template": "users_by_group", "params": {"group_id": group1.id, "limit": 1}})
+        self.assertEqual([u.name for u in result], ["foo"])
+
+    def test_execute__reuses_compiled_statement(self):
+        target = self._makeOne(self.parser)
+        self._registerUsersByGroup(target)
+
+        for group_id in [1, 2, 1]:
+            rows = target.execute({"template": "users_by_group", "params": {"group_id": group_id, "limit": 10}})
+            self.assertTrue(all(row.group_id == group_id for row in rows))
+        self.assertEqual(len(target.templates["users_by_group"].compiled_cache), 1)
+
+    def test_not_found(self):
+        from block.sqla.lispy.template import TemplateNotFound
+        target = self._makeOne(self.parser)
+        with self.assertRaises(TemplateNotFound):
+            target({"template": "users_by_group", "params": {}})
+
+    def test_invalid_type(self):
+        from block.sqla.lispy.template import InvalidParameter
+        target = self._makeOne(self.parser)
+        self._registerUsersByGroup(target)
+        with self.assertRaises(InvalidParameter):
+            target({"template": "users_by_group", "params": {"group_id": "1", "limit": 10}})
+
+    def test_missing_or_unknown_params(self):
+        from block.sqla.lispy.template import InvalidParameter
+        target = self._makeOne(self.parser)
+        self._registerUsersByGroup(target)
+        with self.assertRaises(InvalidParameter):
+            target({"template": "users_by_group", "params": {"group_id": 1}})
+        with self.assertRaises(InvalidParameter):
+            target({"template": "users_by_group", "params": {"group_id": 1, "limit": 10, "name": "foo"}})
+
+    def test_register_document(self):
+        from block.sqla.lispy import create_parser, MacroRegistry
+        from block.sqla.lispy.template import InvalidParameter
+        macros = MacroRegistry()
+        macros.register("group_scope", lambda _: {"filter": ["=", ":User.group_id", sa.bindparam("group_id")]}, pure=True)
+        parser = create_parser(self.Base, self.Session.query, macros=macros)
+        target = self._makeOne(parser)
+        target.register("named", {"@cascade": [{"query": ":User", "@group_scope": True},
+                                               {"filter": ["like", ":User.name", sa.bindparam("name")]}],
+                                  "order_by": ":User.id"})
+
+        result = target({"template": "named", "params": {"group_id": 1, "name": "%oo"}})
+        self.assertEqual([u.name for u in result], ["foo", "boo"])
+        with self.assertRaises(InvalidParameter):
+            target({"template": "named", "params": {"group_id": 1, "name": 1}})
+
+    def test_register_document__in(self):
+        from block.sqla.lispy.template import InvalidParameter
+        target = self._makeOne(self.parser)
+        target.register("users_in", {"query": ":User", "filter": ["in", ":User.id", sa.bindparam("ids")], "order_by": ":User.id"})
+
+        result = target({"template": "users_in", "params": {"ids": [1, 3, 100]}})
+        self.assertEqual([u.name for u in result], ["foo", "bar"])
+        result = target({"template": "users_in", "params": {"ids": [2]}})
+        self.assertEqual([u.name for u in result], ["boo"])
+        rows = target.execute({"template": "users_in", "params": {"ids": [1, 2]}})
+        self.assertEqual([row.name for row in rows], ["foo", "boo"])
+        with self.assertRaises(InvalidParameter):
+            target({"template": "users_in", "params": {"ids": 1}})
+        with self.assertRaises(InvalidParameter):
+            target({"template": "users_in", "params": {"ids": ["1"]}})
+
+if __name__ == '__main__':
+    unittest.main()
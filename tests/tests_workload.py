@@ -0,0 +1,99 @@
+# -*- coding:utf-8 -*-
+import io
+import os
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.declarative import declarative_base
+import unittest
+
+def _makeBase():
+    Base = declarative_base()
+    class Group(Base):
+        __tablename__ = "groups"
+        id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+        name = sa.Column(sa.String(255), unique=True, nullable=False)
+
+    class User(Base):
+        __tablename__ = "users"
+        id = sa.Column(sa.Integer(), primary_key=True, nullable=False)
+        group_id = sa.Column(sa.Integer(), sa.ForeignKey("groups.id"))
+        name = sa.Column(sa.String(255), unique=True, nullable=False)
+        active = sa.Column(sa.Boolean(), nullable=False, default=True)
+    Base.models = [Group, User] # the class registry holds weak references
+    return Base
+
+class RecorderTests(unittest.TestCase):
+    def _makeOne(self, *args, **kwargs):
+        from block.sqla.lispy import create_parser
+        from block.sqla.lispy.workload import Recorder
+        parser_kwargs = {"macros": kwargs.pop("macros")} if "macros" in kwargs else {}
+        parser = create_parser(_makeBase(), lambda *args: orm.Query(args), **parser_kwargs)
+        return Recorder(parser, *args, **kwargs)
+
+    def test_it(self):
+        from block.sqla.lispy.workload import load_documents
+        fp = io.StringIO()
+        target = self._makeOne(fp)
+        target({"@cascade": [{"query": ":User"}, {"limit": 10}]})
+        self.assertEqual(fp.getvalue(), '{"limit":10,"query":":User"}\n')
+        fp.seek(0)
+        self.assertEqual(list(load_documents(fp)), [{"query": ":User", "limit": 10}])
+
+    def test_sampling(self):
+        fp = io.StringIO()
+        samples = iter([0.5, 0.05])
+        target = self._makeOne(fp, rate=0.1, random=lambda: next(samples))
+        target({"query": ":User", "limit": 1})
+        target({"query": ":User", "limit": 2})
+        self.assertEqual(fp.getvalue(), '{"limit":2,"query":":User"}\n')
+
+    def test_not_serializable(self):
+        from block.sqla.lispy import MacroRegistry
+        macros = MacroRegistry()
+        macros.register("group_scope", lambda _: {"filter": ["=", ":User.group_id", sa.bindparam("group_id")]}, pure=True)
+        fp = io.StringIO()
+        target = self._makeOne(fp, macros=macros)
+        query = target({"query": ":User", "@group_scope": True}).params(group_id=1)
+        self.assertIn("users.group_id = :group_id", str(query))
+        self.assertEqual(fp.getvalue(), "")
+        self.assertEqual(target.skipped, 1)
+
+    def test_closed_file(self):
+        fp = io.StringIO()
+        fp.close()
+        target = self._makeOne(fp)
+        target({"query": ":User", "limit": 1})
+        self.assertEqual(target.errors, 1)
+
+
+class ReplayTests(unittest.TestCase):
+    def setUp(self):
+        from block.sqla.lispy.workload import create_sqlite_copy
+        self.Base = _makeBase()
+        self.engine = create_sqlite_copy(self.Base)
+        self.addCleanup(os.remove, self.engine.url.database)
+        self.addCleanup(self.engine.dispose)
+
+    def test_generate_documents(self):
+        from block.sqla.lispy import create_parser
+        from block.sqla.lispy.workload import generate_documents
+        parser = create_parser(self.Base, lambda *args: orm.Query(args))
+        documents = list(generate_documents(self.Base, 20))
+        self.assertEqual(len(documents), 20)
+        self.assertEqual(documents, list(generate_documents(self.Base, 20)))
+        for data in documents:
+            str(parser(data))
+
+    def test_replay(self):
+        from block.sqla.lispy import create_parser, QueryCache
+        from block.sqla.lispy.workload import replay, generate_documents
+        parser = create_parser(self.Base, lambda *args: orm.Query(args), cache=QueryCache())
+        documents = list(generate_documents(self.Base, 5)) * 4
+        result = replay(parser, documents, orm.sessionmaker(bind=self.engine), threads=4, rate=1000)
+        self.assertEqual(result["documents"], 20)
+        self.assertEqual(result["errors"], [])
+        self.assertTrue(result["latency"]["p50"] <= result["latency"]["p99"] <= result["latency"]["max"])
+        self.assertTrue(result["cache"]["hits"] > 0)
+
+if __name__ == '__main__':
+    unittest.main()